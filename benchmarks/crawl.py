@@ -0,0 +1,217 @@
+"""
+crawl a synthetic site and report throughput, memory and latency
+
+    python -m benchmarks.crawl --pages 5000 --latency 0.01 --output run.json
+    python -m benchmarks.crawl --pages 5000 --latency 0.01 --compare run.json
+
+by default the site is served from this process, use --url to crawl one
+started with python -m benchmarks.synthetic so it doesn't compete for cpu
+"""
+
+import sys
+import time
+import json
+import asyncio
+import argparse
+import platform
+import resource
+import tracemalloc
+
+import iterweb
+from iterweb import Spider, Request
+
+from .synthetic import SyntheticSite
+
+
+class BenchSpider(Spider):
+    """
+    follows every link and yields one item per page, remembers how
+    long each fetch took
+    """
+
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.latencies = []
+
+    async def fetch(self, session, url, attempt=0, request=None):
+        start = time.perf_counter()
+
+        try:
+            return await super().fetch(session, url, attempt, request)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+    async def parse(self, response):
+        for href in response.xpath('//a/@href').getall():
+            yield Request(response.urljoin(href))
+
+        yield {'url': response.url, 'size': len(response.body)}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+def peak_rss():
+    "bytes"
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+def request_memory(count=100000):
+    """
+    bytes per Request in a frontier, not counting the url itself
+    """
+    urls = ['http://example.com/%d' % i for i in range(count)]
+    parse = BenchSpider.parse
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        requests = list(Request.from_urls(urls, callback=parse))
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+    del requests
+    return (after - before) / count
+
+async def run(args):
+    site = SyntheticSite(
+        pages=args.pages, fanout=args.fanout, page_size=args.page_size,
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        seed=args.seed,
+    )
+
+    runner = None
+    url = args.url
+
+    if url is None:
+        runner, url = await site.start()
+
+    spider = BenchSpider(
+        max_concurrency=args.max_concurrency,
+        host_concurrency=args.host_concurrency,
+    )
+
+    items = 0
+    start = time.perf_counter()
+
+    try:
+        async for _ in spider.crawl(url, ordered=not args.unordered):
+            items += 1
+    finally:
+        elapsed = time.perf_counter() - start
+
+        await spider.close()
+        if runner is not None:
+            await runner.cleanup()
+
+    latencies = spider.latencies
+    stats = spider.stats
+
+    return {
+        'pages': stats.pages_fetched,
+        'errors': stats.fetch_errors,
+        'items': items,
+        'bytes': stats.bytes_downloaded,
+        'elapsed': elapsed,
+        'pages_per_second': stats.pages_fetched / elapsed,
+        'items_per_second': items / elapsed,
+        'peak_rss': peak_rss(),
+        'request_bytes': request_memory(),
+        'connection_reuse': spider.session_pool.stats()['reuse_ratio'],
+        'latency': {
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p99': percentile(latencies, 99),
+            'max': max(latencies, default=0.0),
+        },
+    }
+
+def compare(results, baseline, tolerance):
+    """
+    print how results differ from baseline, return False if
+    anything got worse by more than tolerance
+    """
+    ok = True
+
+    checks = [
+        ('pages_per_second', results['pages_per_second'], baseline['pages_per_second'], True),
+        ('items_per_second', results['items_per_second'], baseline['items_per_second'], True),
+        ('peak_rss', results['peak_rss'], baseline['peak_rss'], False),
+        ('latency.p99', results['latency']['p99'], baseline['latency']['p99'], False),
+    ]
+
+    # older baselines don't have it
+    if 'request_bytes' in baseline:
+        checks.append(('request_bytes', results['request_bytes'], baseline['request_bytes'], False))
+
+    for name, new, old, higher_is_better in checks:
+        change = (new - old) / old if old else 0.0
+        worse = -change if higher_is_better else change
+        flag = ''
+
+        if worse > tolerance:
+            flag = '  REGRESSION'
+            ok = False
+
+        print("%-18s %12.4g -> %12.4g  %+6.1f%%%s" % (name, old, new, change * 100, flag))
+
+    return ok
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help="crawl this instead of serving the site ourselves")
+    parser.add_argument('--pages', type=int, default=2000)
+    parser.add_argument('--fanout', type=int, default=10)
+    parser.add_argument('--page-size', type=int, default=10000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-concurrency', type=int, default=16)
+    parser.add_argument('--host-concurrency', type=int)
+    parser.add_argument('--unordered', action='store_true')
+    parser.add_argument('--output', help="write results as json")
+    parser.add_argument('--compare', help="json from an earlier run")
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help="allowed fraction worse than --compare before failing")
+    args = parser.parse_args(argv)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    try:
+        results = loop.run_until_complete(run(args))
+    finally:
+        loop.close()
+
+    report = {
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'tolerance')},
+        'results': results,
+        'python': platform.python_version(),
+        'iterweb': iterweb.__version__,
+        'timestamp': time.time(),
+    }
+
+    print(json.dumps(results, indent=2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+        if not compare(results, baseline['results'], args.tolerance):
+            return 1
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
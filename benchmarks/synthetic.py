@@ -0,0 +1,110 @@
+"""
+a synthetic site served by aiohttp for benchmarking
+
+pages are /page/<n> for n in range(pages), every page links to the next
+fanout pages (n * fanout + 1 ...) so the whole site is one tree rooted
+at /page/0. Everything is derived from the page number and seed so the
+same arguments always produce the same site.
+"""
+
+import random
+import asyncio
+
+import aiohttp.web
+
+
+class SyntheticSite:
+
+    def __init__(self, pages=1000, fanout=10, page_size=10000,
+                 latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        """
+        pages: number of pages in the site
+        fanout: links per page
+        page_size: approximate bytes per page
+        latency: seconds added to every response
+        jitter: up to this many extra seconds, random per page
+        error_rate: fraction of pages that return a 500
+        """
+        self.pages = pages
+        self.fanout = fanout
+        self.page_size = page_size
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.seed = seed
+
+        self.served = 0
+        self.errors = 0
+
+    def links(self, n):
+        first = n * self.fanout + 1
+        return [i for i in range(first, first + self.fanout) if i < self.pages]
+
+    def html(self, n):
+        links = ''.join('<li><a href="/page/%d">page %d</a></li>\n' % (i, i) for i in self.links(n))
+        head = '<!DOCTYPE html>\n<html><head><title>page %d</title></head><body>\n<ul>\n%s</ul>\n' % (n, links)
+
+        filler = max(0, self.page_size - len(head) - 20)
+        words = ('lorem ipsum dolor sit amet ' * (filler // 27 + 1))[:filler]
+
+        return head + '<p>' + words + '</p></body></html>'
+
+    async def page(self, request):
+        n = int(request.match_info['n'])
+
+        if not 0 <= n < self.pages:
+            raise aiohttp.web.HTTPNotFound()
+
+        rand = random.Random(self.seed * 1000003 + n)
+        delay = self.latency + rand.random() * self.jitter
+
+        if delay:
+            await asyncio.sleep(delay)
+
+        if rand.random() < self.error_rate:
+            self.errors += 1
+            raise aiohttp.web.HTTPInternalServerError()
+
+        self.served += 1
+        return aiohttp.web.Response(text=self.html(n), content_type='text/html')
+
+    def app(self):
+        app = aiohttp.web.Application()
+        app.router.add_get('/page/{n}', self.page)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        """
+        serve the site, returns (runner, root url)
+        """
+        runner = aiohttp.web.AppRunner(self.app(), access_log=None)
+        await runner.setup()
+
+        site = aiohttp.web.TCPSite(runner, host, port)
+        await site.start()
+
+        host, port = runner.addresses[0][:2]
+        return runner, 'http://%s:%d/page/0' % (host, port)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="serve a synthetic site")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--pages', type=int, default=1000)
+    parser.add_argument('--fanout', type=int, default=10)
+    parser.add_argument('--page-size', type=int, default=10000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    site = SyntheticSite(
+        pages=args.pages, fanout=args.fanout, page_size=args.page_size,
+        latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+        seed=args.seed,
+    )
+    aiohttp.web.run_app(site.app(), host=args.host, port=args.port, access_log=None)
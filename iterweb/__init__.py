@@ -11,5 +11,9 @@ class DropItemError(Exception):
     "drop item and it's an error"
 
 from .spider import Spider
-from .pipeline import Pipeline
+from .pipeline import Pipeline, cpu_bound
 from .reqresp import Request, Response
+from .offload import pure
+from .links import LinkExtractor
+from .shard import ShardedRunner
+from .filters import ResponseFilter
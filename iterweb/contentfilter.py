@@ -0,0 +1,163 @@
+import re
+import inspect
+from collections import Counter
+from hashlib import blake2b
+
+from .pipeline import load_object
+
+import logging
+logger = logging.getLogger(__name__)
+
+word_re = re.compile(r'\w+')
+
+# the words a person would read, not scripts and styles
+TEXT_XPATH = '//body//text()[not(ancestor::script or ancestor::style)]'
+
+
+def hash64(data):
+    return int.from_bytes(blake2b(data, digest_size=8).digest(), 'little')
+
+def simhash(tokens):
+    """
+    64 bit simhash of an iterable of strings, similar token
+    collections get hashes that differ in only a few bits
+    """
+    weights = [0] * 64
+
+    for token, count in Counter(tokens).items():
+        h = hash64(token.encode('utf-8', 'surrogateescape'))
+        for bit in range(64):
+            weights[bit] += count if h >> bit & 1 else -count
+
+    return sum(1 << bit for bit, weight in enumerate(weights) if weight > 0)
+
+def page_words(response):
+    """
+    lower cased words of the visible text of response
+    """
+    root = response.selector.root
+    texts = root.xpath(TEXT_XPATH) if root is not None else None
+
+    if not texts: # not html or no <body>
+        texts = [response.text]
+
+    return [word.lower() for text in texts for word in word_re.findall(text)]
+
+
+class ContentFilter:
+    """
+    remembers fingerprints of response bodies so a page served under
+    several urls is only parsed once
+
+    subclasses implement _seen(response) that returns True if the
+    content was seen before, else remembers it and returns False
+    """
+
+    def __init__(self):
+        self.hits = 0   # seen() found a duplicate
+        self.misses = 0 # seen() found new content
+
+    def seen(self, response):
+        if self._seen(response):
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        return False
+
+    def __len__(self):
+        return self.misses
+
+    def stats(self):
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class HashContentFilter(ContentFilter):
+    """
+    exact, an 8 byte hash of the body
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.fingerprints = set()
+
+    def _seen(self, response):
+        fingerprint = hash64(response.body)
+
+        if fingerprint in self.fingerprints:
+            return True
+
+        self.fingerprints.add(fingerprint)
+        return False
+
+
+class SimhashContentFilter(ContentFilter):
+    """
+    near duplicates, pages whose text simhashes differ in at most
+    distance bits are the same page, so a changing timestamp or
+    session id doesn't make a page new
+
+    the 64 bits are split into distance + 1 bands, two hashes within
+    distance bits of each other must have an identical band so only
+    hashes sharing a band get compared
+    """
+
+    def __init__(self, distance=3):
+        super().__init__()
+        self.distance = distance
+        self.bands = distance + 1
+        self.band_bits = 64 // self.bands
+        self.index = [{} for _ in range(self.bands)]
+
+    def _band_keys(self, fingerprint):
+        mask = (1 << self.band_bits) - 1
+
+        for band in range(self.bands):
+            shift = band * self.band_bits
+            # the last band gets the leftover bits
+            if band == self.bands - 1:
+                yield fingerprint >> shift
+            else:
+                yield fingerprint >> shift & mask
+
+    def _seen(self, response):
+        fingerprint = simhash(page_words(response))
+        keys = list(self._band_keys(fingerprint))
+
+        for index, key in zip(self.index, keys):
+            for other in index.get(key, ()):
+                if bin(fingerprint ^ other).count('1') <= self.distance:
+                    return True
+
+        for index, key in zip(self.index, keys):
+            index.setdefault(key, []).append(fingerprint)
+
+        return False
+
+
+CONTENT_FILTERS = {
+    'hash': HashContentFilter,
+    'simhash': SimhashContentFilter,
+}
+
+def build_content_filter(content_filter=None):
+    """
+    content_filter can be None, a name in CONTENT_FILTERS, a ContentFilter
+    class (or the dotted path to one) or an already built ContentFilter
+    """
+    if content_filter is None:
+        return None
+
+    if isinstance(content_filter, str):
+        content_filter = CONTENT_FILTERS.get(content_filter) or load_object(content_filter)
+
+    if inspect.isclass(content_filter):
+        content_filter = content_filter()
+
+    assert isinstance(content_filter, ContentFilter), "content_filter must be a ContentFilter"
+
+    return content_filter
@@ -0,0 +1,220 @@
+import sys
+import math
+import inspect
+from hashlib import blake2b
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from .pipeline import load_object
+
+import logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def canonicalize_url(url):
+    """
+    normalize url so that trivially different urls for the same page
+    compare equal, the fragment is dropped, scheme and host are lower
+    cased, the default port is removed and query args are sorted
+    """
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+
+    netloc = parts.hostname or ''
+    if ':' in netloc: # ipv6
+        netloc = '[%s]' % netloc
+
+    if parts.username:
+        userinfo = parts.username
+        if parts.password:
+            userinfo += ':' + parts.password
+        netloc = userinfo + '@' + netloc
+
+    try:
+        port = parts.port
+    except ValueError: # garbage port, leave it alone
+        port = None
+        netloc = parts.netloc.lower()
+
+    if port and port != DEFAULT_PORTS.get(scheme):
+        netloc += ':%d' % port
+
+    path = parts.path
+    if netloc and not path:
+        path = '/'
+
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    query = urlencode(sorted(query))
+
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+class DupeFilter:
+    """
+    remembers which urls have been seen, urls are canonicalized first
+    unless canonicalize is None
+
+    subclasses implement _add(key) and _contains(key) where key is
+    the canonical url
+    """
+
+    def __init__(self, canonicalize=canonicalize_url):
+        self.canonicalize = canonicalize
+        self.hits = 0   # seen() found a duplicate
+        self.misses = 0 # seen() found a new url
+
+    def key(self, url):
+        return self.canonicalize(url) if self.canonicalize else url
+
+    def seen(self, url):
+        """
+        return True if url has been seen before, else remember it
+        and return False
+        """
+        key = self.key(url)
+
+        if self._contains(key):
+            self.hits += 1
+            return True
+
+        self.misses += 1
+        self._add(key)
+        return False
+
+    def add(self, url):
+        self._add(self.key(url))
+
+    def __contains__(self, url):
+        return self._contains(self.key(url))
+
+    def __len__(self):
+        return self.misses
+
+    def memory_usage(self):
+        "approximate number of bytes used to remember urls"
+        raise NotImplementedError()
+
+    def stats(self):
+        return {
+            'entries': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'memory': self.memory_usage(),
+        }
+
+
+class SetDupeFilter(DupeFilter):
+    """
+    exact, remembers every url string
+    """
+
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.urls = set()
+        self._bytes = 0
+
+    def _add(self, key):
+        if key not in self.urls:
+            self.urls.add(key)
+            self._bytes += sys.getsizeof(key)
+
+    def _contains(self, key):
+        return key in self.urls
+
+    def __len__(self):
+        return len(self.urls)
+
+    def memory_usage(self):
+        return sys.getsizeof(self.urls) + self._bytes
+
+
+class FingerprintDupeFilter(DupeFilter):
+    """
+    remembers an 8 byte hash of every url instead of the url itself,
+    two different urls colliding is astronomically unlikely
+    """
+
+    def __init__(self, **kw):
+        super().__init__(**kw)
+        self.fingerprints = set()
+
+    @staticmethod
+    def fingerprint(key):
+        digest = blake2b(key.encode('utf-8', 'surrogateescape'), digest_size=8).digest()
+        return int.from_bytes(digest, 'little')
+
+    def _add(self, key):
+        self.fingerprints.add(self.fingerprint(key))
+
+    def _contains(self, key):
+        return self.fingerprint(key) in self.fingerprints
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def memory_usage(self):
+        # an 8 byte int is a 32 byte object
+        return sys.getsizeof(self.fingerprints) + 32 * len(self.fingerprints)
+
+
+class BloomDupeFilter(DupeFilter):
+    """
+    a bloom filter sized for capacity urls with a false positive rate
+    of error_rate, memory use is fixed no matter how many urls are added
+
+    a false positive means a url that was never crawled is thought to
+    be a duplicate and is skipped
+    """
+
+    def __init__(self, capacity=1000000, error_rate=0.001, **kw):
+        super().__init__(**kw)
+        assert 0 < error_rate < 1, "error_rate must be between 0 and 1"
+
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+        self.num_bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key):
+        # double hashing, see Kirsch and Mitzenmacher
+        digest = blake2b(key.encode('utf-8', 'surrogateescape'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def _add(self, key):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def _contains(self, key):
+        bits = self.bits
+        return all(bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+    def memory_usage(self):
+        return sys.getsizeof(self.bits)
+
+
+DUPEFILTERS = {
+    'set': SetDupeFilter,
+    'fingerprint': FingerprintDupeFilter,
+    'bloom': BloomDupeFilter,
+}
+
+def build_dupefilter(dupefilter='set'):
+    """
+    dupefilter can be a name in DUPEFILTERS, a DupeFilter class (or
+    the dotted path to one) or an already built DupeFilter
+    """
+    if isinstance(dupefilter, str):
+        dupefilter = DUPEFILTERS.get(dupefilter) or load_object(dupefilter)
+
+    if inspect.isclass(dupefilter):
+        dupefilter = dupefilter()
+
+    assert isinstance(dupefilter, DupeFilter), "dupefilter must be a DupeFilter"
+
+    return dupefilter
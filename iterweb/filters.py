@@ -0,0 +1,87 @@
+import fnmatch
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ResponseFiltered(Exception):
+    """
+    raised by Spider.fetch() when a response was refused by a
+    ResponseFilter, its body was never (fully) read
+    """
+
+
+class ResponseFilter:
+    """
+    decide from the headers whether a response is worth downloading
+
+    content_types: allowed types, globs like text/* are fine, a
+                   response without a Content-Type is allowed
+    max_size: bytes, refused if Content-Length is bigger or the body
+              grows past it while being read
+    predicate: predicate(headers) returns False to refuse
+
+    Spider(content_types=['text/html'], max_size=2 ** 20)
+    Request(url, response_filter=ResponseFilter()) # no filtering
+    """
+
+    def __init__(self, content_types=None, max_size=None, predicate=None):
+        if isinstance(content_types, str):
+            content_types = [content_types]
+
+        self.content_types = [t.lower() for t in content_types] if content_types else None
+        self.max_size = max_size
+        self.predicate = predicate
+
+    def content_type_ok(self, headers):
+        if not self.content_types:
+            return True
+
+        content_type = headers.get('Content-Type')
+        if not content_type:
+            return True
+
+        mimetype = content_type.split(';', 1)[0].strip().lower()
+        return any(fnmatch.fnmatchcase(mimetype, allowed) for allowed in self.content_types)
+
+    def refuse(self, headers):
+        """
+        the reason headers aren't acceptable or None if they are
+        """
+        if not self.content_type_ok(headers):
+            return "content type %s" % headers.get('Content-Type')
+
+        if self.max_size:
+            try:
+                length = int(headers.get('Content-Length'))
+            except (TypeError, ValueError):
+                length = None
+
+            if length is not None and length > self.max_size:
+                return "content length %d" % length
+
+        if self.predicate is not None and not self.predicate(headers):
+            return "predicate"
+
+        return None
+
+    async def read(self, resp, chunk_size=64 * 1024):
+        """
+        read resp's body, raise ResponseFiltered if it grows past max_size
+        """
+        if not self.max_size:
+            return await resp.read()
+
+        chunks = []
+        size = 0
+
+        async for chunk in resp.content.iter_chunked(chunk_size):
+            size += len(chunk)
+
+            if size > self.max_size:
+                resp.close()
+                raise ResponseFiltered("body over %d bytes" % self.max_size)
+
+            chunks.append(chunk)
+
+        return b''.join(chunks)
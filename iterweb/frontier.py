@@ -0,0 +1,105 @@
+import asyncio
+import inspect
+import itertools
+from heapq import heappush, heappop
+
+from .pipeline import load_object
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Frontier(asyncio.Queue):
+    """
+    the queue of Requests waiting to be fetched, first in first out
+    which crawls a site breadth first
+
+    Requests deeper than max_depth are dropped without being fetched
+
+    subclass and override _init/_put/_get to change the crawl order,
+    the same as asyncio.LifoQueue and asyncio.PriorityQueue do. start(),
+    finished() and close() are called by Spider for frontiers that keep
+    track of the crawl (see DiskFrontier)
+    """
+
+    def __init__(self, max_depth=None, **kw):
+        super().__init__(**kw)
+        self.max_depth = max_depth
+        self.dropped = 0
+
+    def put_nowait(self, request):
+        # Queue.put() ends up here as well
+        if self.max_depth is not None and request.depth > self.max_depth:
+            logger.debug("depth %d > %d, dropping: %s", request.depth, self.max_depth, request.url)
+            self.dropped += 1
+            return
+
+        super().put_nowait(request)
+
+    def requeue(self, request):
+        """
+        put back a request that was already taken off the queue
+        """
+        asyncio.Queue.put_nowait(self, request)
+
+    def start(self, spider, resume=False):
+        "the crawl is starting"
+        if resume:
+            raise NotImplementedError("%s can not resume a crawl" % self.__class__.__name__)
+
+    def finished(self, request):
+        "the request has been fetched and handled"
+
+    def close(self, complete):
+        "the crawl is over, complete is False if it was interrupted"
+
+
+class FifoFrontier(Frontier):
+    "breadth first"
+
+
+class LifoFrontier(Frontier, asyncio.LifoQueue):
+    "depth first"
+
+
+class PriorityFrontier(Frontier):
+    """
+    best first, highest Request.priority comes out first and
+    Requests with the same priority come out in fifo order
+    """
+
+    def _init(self, maxsize):
+        self._queue = []
+        self._count = itertools.count()
+
+    def _put(self, request):
+        heappush(self._queue, (-request.priority, next(self._count), request))
+
+    def _get(self):
+        return heappop(self._queue)[-1]
+
+
+FRONTIERS = {
+    'fifo': FifoFrontier,
+    'bfs': FifoFrontier,
+    'lifo': LifoFrontier,
+    'dfs': LifoFrontier,
+    'priority': PriorityFrontier,
+}
+
+def build_frontier(frontier='fifo', max_depth=None):
+    """
+    frontier can be a name in FRONTIERS, a Frontier class (or the
+    dotted path to one) or an already built Frontier
+    """
+    if isinstance(frontier, str):
+        frontier = FRONTIERS.get(frontier) or load_object(frontier)
+
+    if inspect.isclass(frontier):
+        frontier = frontier(max_depth=max_depth)
+    elif max_depth is not None:
+        frontier.max_depth = max_depth
+
+    assert isinstance(frontier, Frontier), "frontier must be a Frontier"
+
+    return frontier
@@ -0,0 +1,211 @@
+import os
+import re
+import json
+import time
+import hashlib
+from email.utils import parsedate_to_datetime
+
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def parse_cache_control(value):
+    """
+    'no-cache, max-age=60' -> {'no-cache': None, 'max-age': '60'}
+    """
+    directives = {}
+
+    for part in value.split(','):
+        name, _, arg = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+
+    return directives
+
+def parse_http_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+def freshness_lifetime(headers):
+    """
+    number of seconds a response with headers can be served without
+    asking the server, 0 means always revalidate and None means it
+    mustn't be stored at all
+    """
+    cc = parse_cache_control(headers.get('Cache-Control', ''))
+
+    if 'no-store' in cc:
+        return None
+
+    if 'no-cache' in cc:
+        return 0
+
+    for name in ('s-maxage', 'max-age'):
+        if cc.get(name):
+            try:
+                return max(0, int(cc[name]))
+            except ValueError:
+                return 0
+
+    expires = parse_http_date(headers.get('Expires'))
+
+    if expires is not None:
+        date = parse_http_date(headers.get('Date')) or time.time()
+        return max(0, expires - date)
+
+    return 0
+
+
+class CachedResponse:
+    """
+    quacks enough like an aiohttp.ClientResponse with a read body that
+    Spider and Response can't tell the difference
+    """
+
+    charset_re = re.compile(r'charset=([\w-]+)', re.I)
+
+    def __init__(self, url, status, headers, body, stored):
+        self.url = URL(url)
+        self.status = status
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self._body = body
+        self.stored = stored # time.time() when fetched or revalidated
+        self.from_cache = True
+
+    @property
+    def lifetime(self):
+        return freshness_lifetime(self.headers) or 0
+
+    @property
+    def fresh(self):
+        return time.time() - self.stored < self.lifetime
+
+    def validators(self):
+        "headers for a conditional request"
+        headers = {}
+
+        if 'ETag' in self.headers:
+            headers['If-None-Match'] = self.headers['ETag']
+
+        if 'Last-Modified' in self.headers:
+            headers['If-Modified-Since'] = self.headers['Last-Modified']
+
+        return headers
+
+    def get_encoding(self):
+        match = self.charset_re.search(self.headers.get('Content-Type', ''))
+        return match.group(1) if match else None
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+    def release(self):
+        pass
+
+
+class HttpCache:
+    """
+    stores response headers and bodies in directory keyed by url,
+    honours Cache-Control and Expires and revalidates stale entries
+    with If-None-Match/If-Modified-Since
+
+    hits: served from cache without asking the server
+    misses: not cached or can't be revalidated
+    revalidated: server said 304 not modified
+    """
+
+    # don't keep hop-by-hop or per-message headers
+    skip_headers = {'connection', 'keep-alive', 'transfer-encoding', 'content-length'}
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+    def path(self, url):
+        key = hashlib.sha1(str(url).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key[:2], key)
+
+    def lookup(self, url):
+        """
+        return a CachedResponse or None
+        """
+        path = self.path(url)
+
+        try:
+            with open(path + '.json') as f:
+                meta = json.load(f)
+            with open(path + '.body', 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+
+        return CachedResponse(url, meta['status'], meta['headers'], body, meta['stored'])
+
+    def store(self, url, resp):
+        """
+        save resp (with a read body) if it's allowed to be cached,
+        returns the CachedResponse or None
+        """
+        if resp.status != 200 or freshness_lifetime(resp.headers) is None:
+            return None
+
+        headers = [
+            (name, value) for name, value in resp.headers.items()
+            if name.lower() not in self.skip_headers
+        ]
+        cached = CachedResponse(url, resp.status, headers, resp._body, time.time())
+        self.save(cached)
+
+        return cached
+
+    def save(self, cached):
+        path = self.path(cached.url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        meta = {
+            'url': str(cached.url),
+            'status': cached.status,
+            'headers': list(cached.headers.items()),
+            'stored': cached.stored,
+        }
+
+        # write body first, a missing .json means not cached
+        with open(path + '.body', 'wb') as f:
+            f.write(cached._body)
+        with open(path + '.json', 'w') as f:
+            json.dump(meta, f)
+
+    def refresh(self, cached, headers):
+        """
+        server said 304, update cached with headers from the 304
+        """
+        merged = CIMultiDict(cached.headers)
+
+        for name in ('Cache-Control', 'Expires', 'Date', 'ETag', 'Last-Modified'):
+            if name in headers:
+                merged[name] = headers[name]
+
+        cached.headers = CIMultiDictProxy(merged)
+        cached.stored = time.time()
+        self.save(cached)
+
+        return cached
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidated': self.revalidated,
+        }
@@ -0,0 +1,110 @@
+import re
+from urllib.parse import urljoin, urlsplit
+
+from .dupefilter import canonicalize_url
+from .reqresp import Request
+
+import logging
+logger = logging.getLogger(__name__)
+
+# '' for relative urls, when the page's url was relative too
+SCHEMES = frozenset({'http', 'https', ''})
+
+
+def compile_patterns(patterns):
+    if isinstance(patterns, (str, re.Pattern)):
+        patterns = [patterns]
+    return [re.compile(p) for p in patterns or ()]
+
+def same_domain(host, domain):
+    return host == domain or host.endswith('.' + domain)
+
+
+class LinkExtractor:
+    """
+    pull the links out of a page in one pass over the lxml tree
+
+    tags/attrs: elements and attributes that hold links
+    allow/deny: regexes (or lists of them) searched for in the absolute
+                url, a link must match an allow (if given) and no deny
+    same_domain: only links to the page's host or its subdomains
+    canonicalize: canonicalize the urls, dropping fragments and such
+
+    links are resolved against <base href> when the page has one,
+    anything that isn't http(s) is skipped and each url is returned
+    once, in the order it first appears
+
+    extractor = LinkExtractor(allow=r'/product/', same_domain=True)
+
+    async def parse(self, response):
+        for request in extractor.requests(response, callback=self.parse_product):
+            yield request
+    """
+
+    def __init__(self, allow=(), deny=(), tags=('a', 'area'), attrs=('href',),
+                 same_domain=False, canonicalize=True):
+        self.allow = compile_patterns(allow)
+        self.deny = compile_patterns(deny)
+        self.tags = tuple(tags)
+        self.attrs = tuple(attrs)
+        self.same_domain = same_domain
+        self.canonicalize = canonicalize
+
+    def base_url(self, response, root):
+        for base in root.iter('base'):
+            href = base.get('href')
+            if href:
+                return urljoin(response.url, href.strip())
+        return response.url
+
+    def allowed(self, url):
+        if self.allow and not any(p.search(url) for p in self.allow):
+            return False
+        return not any(p.search(url) for p in self.deny)
+
+    def extract(self, response):
+        """
+        list of absolute urls linked to by response
+        """
+        root = response.selector.root
+        if root is None:
+            return []
+
+        base = self.base_url(response, root)
+        domain = (urlsplit(response.url).hostname or '') if self.same_domain else None
+        attrs = self.attrs
+        seen = {}
+
+        for el in root.iter(*self.tags):
+            for attr in attrs:
+                href = el.get(attr)
+                if not href:
+                    continue
+
+                try:
+                    url = urljoin(base, href.strip())
+                    parts = urlsplit(url)
+                    hostname = parts.hostname or ''
+                except ValueError: # eg. a mangled ipv6 address
+                    continue
+
+                if parts.scheme not in SCHEMES:
+                    continue
+
+                if domain is not None and not same_domain(hostname, domain):
+                    continue
+
+                if self.canonicalize:
+                    url = canonicalize_url(url)
+
+                if url not in seen:
+                    seen[url] = self.allowed(url)
+
+        return [url for url, allowed in seen.items() if allowed]
+
+    def requests(self, response, **kw):
+        """
+        list of Requests for extract(response), kw (callback, priority)
+        is passed to Request.from_urls()
+        """
+        return list(Request.from_urls(self.extract(response), **kw))
@@ -0,0 +1,92 @@
+import asyncio
+import inspect
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from .httpcache import CachedResponse
+from .reqresp import Request, Response
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def pure(func):
+    """
+    mark a parse function as pure, it only looks at the response it's
+    given and only communicates by what it yields/returns. A pure function
+    can be run in another process when the Spider has an executor.
+
+    decoding the body and building the Selector happen in that process
+    as well so the event loop is left to do network I/O
+
+    the function must be importable (not a closure or a method) and
+    everything it yields must be picklable, a Request's callback must
+    be None or another importable function
+
+    @pure
+    def parse(response):
+        for href in response.xpath('//a/@href').getall():
+            yield Request(response.urljoin(href))
+    """
+    func.pure = True
+    return func
+
+def is_pure(func):
+    while isinstance(func, partial):
+        func = func.func
+    return getattr(func, 'pure', False)
+
+def build_executor(executor):
+    """
+    executor can be None, a number of processes or an Executor
+    """
+    if isinstance(executor, int):
+        executor = ProcessPoolExecutor(executor)
+
+    return executor
+
+def run_pure(func, url, status, headers, body, depth):
+    """
+    runs in the worker process, rebuild the response and return
+    a list of everything func emitted
+    """
+    resp = CachedResponse(url, status, headers, body, stored=0)
+    response = Response(url, resp, Request(url, depth=depth))
+
+    if inspect.isasyncgenfunction(func):
+        async def collect():
+            return [item async for item in func(response)]
+        return asyncio.run(collect())
+
+    if asyncio.iscoroutinefunction(func):
+        return [asyncio.run(func(response))]
+
+    if inspect.isgeneratorfunction(func):
+        return list(func(response))
+
+    return [func(response)]
+
+async def offload(executor, func, response):
+    """
+    async generator that runs func(response) in executor, or inline
+    if there isn't one, and yields what it emitted
+    """
+    assert response.body is not None, "can not offload a streamed response"
+
+    args = (
+        func,
+        response.url,
+        response.status,
+        list(response.headers.items()),
+        response.body,
+        response.depth,
+    )
+
+    if executor is None:
+        items = run_pure(*args)
+    else:
+        loop = asyncio.get_running_loop()
+        items = await loop.run_in_executor(executor, run_pure, *args)
+
+    for item in items:
+        yield item
@@ -0,0 +1,220 @@
+import time
+import inspect
+import sqlite3
+from collections import deque
+from functools import partial
+
+from .frontier import Frontier
+from .pipeline import load_object
+from .reqresp import Request
+
+import logging
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    id       INTEGER PRIMARY KEY,
+    url      TEXT NOT NULL,
+    callback TEXT,
+    priority INTEGER NOT NULL,
+    depth    INTEGER NOT NULL,
+    spilled  INTEGER NOT NULL DEFAULT 0,
+    done     INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS requests_url ON requests (url);
+CREATE INDEX IF NOT EXISTS requests_spilled ON requests (spilled, id);
+"""
+
+
+# callbacks that were warned about, by qualname, a closure is a new
+# object for every page it's made on
+unnamed_callbacks = set()
+
+def callback_name(callback, spider=None):
+    """
+    a name that callback can be loaded from by resolve_callback(),
+    None if it's spider's own callback, which a Request without one
+    gets anyway, or if it can't be named (eg. a closure)
+    """
+    if callback is None:
+        return None
+
+    if spider is not None and callback == spider.callback:
+        return None
+
+    if inspect.ismethod(callback):
+        return callback.__name__ # assume it's a method of the spider
+
+    qualname = getattr(callback, '__qualname__', '')
+
+    if not qualname or '<locals>' in qualname or not hasattr(callback, '__module__'):
+        func = callback
+        while isinstance(func, partial):
+            func = func.func
+
+        key = getattr(func, '__qualname__', None) or type(func).__name__
+
+        if key not in unnamed_callbacks:
+            unnamed_callbacks.add(key)
+            logger.warning("can not save callback: %s, the spider's callback is used instead", key)
+
+        return None
+
+    return '%s.%s' % (callback.__module__, qualname)
+
+def resolve_callback(spider, name):
+    if name is None:
+        return None
+
+    if '.' not in name:
+        return getattr(spider, name)
+
+    return load_object(name)
+
+
+class DiskFrontier(Frontier):
+    """
+    a fifo frontier that records every Request in a sqlite database so
+    that a killed crawl can be resumed with crawl(resume=True), it also
+    keeps at most memory_limit Requests in memory and spills the rest
+    to disk
+
+    the seen urls are rebuilt from the database on resume so the
+    spider's dupefilter doesn't need to be saved separately
+
+    callbacks are saved by name, a closure can't be so Requests with
+    one get the spider's callback on resume. A Request's method, headers,
+    meta, body and response_filter aren't saved, resumed Requests are
+    plain GETs
+
+    changes are committed every commit_every statements or commit_interval
+    seconds, whichever comes first, that's what a kill can lose
+    """
+
+    def __init__(self, path, memory_limit=10000, commit_every=100, commit_interval=1.0, **kw):
+        self.path = path
+        self.memory_limit = memory_limit
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+        # rows from a previous run, thrown away unless we resume
+        self.stale_id = self.db.execute('SELECT MAX(id) FROM requests').fetchone()[0] or 0
+
+        self.spider = None
+        self.uncommitted = 0
+        self.committed = time.monotonic()
+
+        super().__init__(**kw)
+
+    def _init(self, maxsize):
+        self._queue = deque()
+        self._spilled = 0
+
+    def qsize(self):
+        return len(self._queue) + self._spilled
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def put_nowait(self, request):
+        if self.max_depth is not None and request.depth > self.max_depth:
+            return super().put_nowait(request) # let Frontier drop it
+
+        spill = self._spilled > 0 or len(self._queue) >= self.memory_limit
+        self.record(request, spill)
+
+        if spill:
+            # nobody can be waiting on a get() as the queue isn't empty
+            self._spilled += 1
+        else:
+            super().put_nowait(request)
+
+    def _put(self, request):
+        self._queue.append(request)
+
+    def _get(self):
+        if not self._queue:
+            self.unspill()
+
+        return self._queue.popleft()
+
+    def record(self, request, spilled):
+        self.db.execute(
+            'INSERT INTO requests (url, callback, priority, depth, spilled) VALUES (?, ?, ?, ?, ?)',
+            (request.url, callback_name(request.callback, self.spider), request.priority, request.depth, int(spilled))
+        )
+        self.commit()
+
+    def unspill(self):
+        """
+        move the oldest spilled requests back into memory
+        """
+        rows = self.db.execute(
+            'SELECT id, url, callback, priority, depth FROM requests'
+            ' WHERE spilled = 1 ORDER BY id LIMIT ?',
+            (self.memory_limit,)
+        ).fetchall()
+
+        for _, url, callback, priority, depth in rows:
+            self._queue.append(Request(
+                url,
+                callback=resolve_callback(self.spider, callback),
+                priority=priority,
+                depth=depth,
+            ))
+
+        if rows:
+            self.db.execute('UPDATE requests SET spilled = 0 WHERE spilled = 1 AND id <= ?', (rows[-1][0],))
+            self.commit()
+
+        self._spilled -= len(rows)
+
+    def commit(self, force=False):
+        self.uncommitted += 1
+        now = time.monotonic()
+
+        if force or self.uncommitted >= self.commit_every or now - self.committed >= self.commit_interval:
+            self.db.commit()
+            self.uncommitted = 0
+            self.committed = now
+
+    def start(self, spider, resume=False):
+        self.spider = spider
+
+        if not resume:
+            self.db.execute('DELETE FROM requests WHERE id <= ?', (self.stale_id,))
+            self.commit(force=True)
+            return
+
+        # everything we've ever queued is a seen url, even when done
+        for (url,) in self.db.execute('SELECT url FROM requests WHERE id <= ?', (self.stale_id,)):
+            spider.dupefilter.add(url)
+
+        # anything not done gets fetched again, including what was
+        # in memory or in flight when we were killed
+        self.db.execute(
+            'UPDATE requests SET spilled = 1 WHERE done = 0 AND id <= ?',
+            (self.stale_id,)
+        )
+        self.commit(force=True)
+
+        self._spilled = self.db.execute('SELECT COUNT(*) FROM requests WHERE spilled = 1').fetchone()[0]
+        logger.info("resuming %s with %d requests", self.path, self._spilled)
+
+        self.stale_id = 0
+
+    def finished(self, request):
+        self.db.execute('UPDATE requests SET done = 1 WHERE url = ? AND done = 0', (request.url,))
+        self.commit()
+
+    def close(self, complete):
+        if complete:
+            # nothing to resume
+            self.db.execute('DELETE FROM requests')
+
+        self.commit(force=True)
@@ -1,9 +1,13 @@
+import time
 import inspect
 import asyncio
 import importlib
+from collections import deque
 from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from . import DropItem, DropItemError
+from .utils import Histogram
 
 import logging
 logger = logging.getLogger(__name__)
@@ -18,15 +22,232 @@ def load_object(name):
     return getattr(module, obj_name)
 
 
+def cpu_bound(stage):
+    """
+    mark a sync stage function (or class) as cpu heavy, it's run in the
+    pipeline's process pool instead of a thread. It's called with None
+    for spider and response, and it and the items must be picklable
+
+    @cpu_bound
+    def phash(spider, response, item):
+        item['hash'] = imagehash.phash(item['image'])
+        return item
+    """
+    stage.cpu_bound = True
+    return stage
+
+
+class StageMetrics:
+    """
+    what a pipeline stage has been up to, latency is in seconds
+
+    calls: items that went into the stage
+    dropped: DropItem raised
+    errors: DropItemError raised
+    exceptions: any other exception raised
+    in_flight: items in the stage right now
+    """
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.in_flight = 0
+        self.reset()
+
+    def reset(self):
+        # in_flight is left alone, those items are still in the stage
+        self.calls = 0
+        self.dropped = 0
+        self.errors = 0
+        self.exceptions = 0
+        self.latency.reset()
+
+    def as_dict(self):
+        return {
+            'calls': self.calls,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'exceptions': self.exceptions,
+            'in_flight': self.in_flight,
+            'latency': self.latency.as_dict(),
+        }
+
+
+class BatchStage:
+    """
+    wraps an instance of a stage class that has process_batch(spider, items)
+
+    items are collected until there are batch_size of them or the oldest
+    has waited batch_wait seconds, then handed to process_batch together.
+    process_batch returns a list with an item (or None to drop it) for each
+    item it was given, or None to pass them all through unchanged
+
+    batch_size and batch_wait are read from the stage class if it has them
+    """
+
+    def __init__(self, obj, batch_size=100, batch_wait=1.0):
+        self.obj = obj
+        self.__name__ = obj.__class__.__name__
+
+        self.batch_size = getattr(obj, 'batch_size', batch_size)
+        self.batch_wait = getattr(obj, 'batch_wait', batch_wait)
+
+        self.batch = [] # (item, future)
+        self.spider = None
+        self.timer = None
+        self.closing = False # flush every item right away
+
+    async def __call__(self, spider, response, item):
+        future = asyncio.get_event_loop().create_future()
+
+        self.spider = spider
+        self.batch.append((item, future))
+
+        if len(self.batch) >= self.batch_size:
+            await self.flush()
+        elif self.timer is None:
+            # when closing still give items arriving now a chance to join
+            self.flush_later(0 if self.closing else self.batch_wait)
+
+        return await future
+
+    def flush_later(self, wait):
+        if self.timer is not None:
+            self.timer.cancel()
+
+        self.timer = asyncio.ensure_future(self._flush_later(wait))
+
+    async def _flush_later(self, wait):
+        await asyncio.sleep(wait)
+        self.timer = None
+        await self.flush()
+
+    def close(self):
+        "stop waiting for batches to fill up"
+        self.closing = True
+
+        if self.batch:
+            self.flush_later(0)
+
+    async def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        batch, self.batch = self.batch, []
+
+        if not batch:
+            return
+
+        items = [item for item, _ in batch]
+
+        try:
+            results = await self.obj.process_batch(self.spider, items)
+
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        if results is None:
+            results = items
+
+        assert len(results) == len(items), "process_batch must return an item for each item"
+
+        for (_, future), result in zip(batch, results):
+            if future.done(): # cancelled
+                continue
+
+            if result is None:
+                future.set_exception(DropItem("dropped by process_batch"))
+            else:
+                future.set_result(result)
+
+
+class SyncStage:
+    """
+    wraps a plain function or process_item method so it runs in an
+    executor and the event loop keeps going while it blocks
+    """
+
+    def __init__(self, func, name, cpu_bound=False):
+        self.func = func
+        self.__name__ = name
+        self.cpu_bound = cpu_bound
+        self.executor = None # set by Pipeline
+
+    async def __call__(self, spider, response, item):
+        loop = asyncio.get_event_loop()
+
+        if self.cpu_bound:
+            # spider and response can't be pickled
+            return await loop.run_in_executor(self.executor, self.func, None, None, item)
+
+        return await loop.run_in_executor(self.executor, self.func, spider, response, item)
+
+
 class Pipeline:
     """
     A pipeline is a list of functions that are called with the item
     that is emitted from Spider.parse(). The item can be modified for
     future stages or a stage can raise DropItem to stop processing.
+
+    A stage class can have process_batch() instead of process_item()
+    to get items in bulk, see BatchStage
+
+    A stage that isn't a coroutine runs in a thread so it can block,
+    or in a process if it's marked with cpu_bound, see SyncStage
     """
 
-    def __init__(self, stages):
+    def __init__(self, stages, concurrency=None, stage_concurrency=None, ordered=True,
+                 executor=None, process_executor=None):
+        """
+        concurrency: how many items can be in the pipeline at once, with
+                     more than one the spider keeps parsing while items
+                     are processed in the background. Defaults to 1 or
+                     the largest batch_size so batches can fill up
+        stage_concurrency: {stage_name: n} limit how many items a
+                           particular stage can work on at once
+        ordered: yield processed items in the order they were emitted
+        executor: number of threads (or an Executor) to run sync stages
+                  in, defaults to the loop's default executor
+        process_executor: number of processes (or an Executor) to run
+                          cpu_bound stages in, defaults to a
+                          ProcessPoolExecutor if there are any
+        """
         self.stages = self.build_pipeline(stages)
+        self.executor = executor
+        self.process_executor = process_executor
+        self.own_executors = [] # the ones we made, see shutdown()
+
+        if isinstance(executor, int):
+            self.executor = ThreadPoolExecutor(executor)
+            self.own_executors.append(self.executor)
+
+        sync_stages = [s for s in self.stages if isinstance(s, SyncStage)]
+
+        if any(s.cpu_bound for s in sync_stages):
+            if process_executor is None or isinstance(process_executor, int):
+                self.process_executor = ProcessPoolExecutor(process_executor)
+                self.own_executors.append(self.process_executor)
+
+        for stage in sync_stages:
+            stage.executor = self.process_executor if stage.cpu_bound else self.executor
+        self.batch_stages = [s for s in self.stages if isinstance(s, BatchStage)]
+
+        if concurrency is None:
+            concurrency = max([1] + [s.batch_size for s in self.batch_stages])
+
+        self.concurrency = concurrency
+        self.ordered = ordered
+        self.slots = asyncio.Semaphore(concurrency)
+        self.stage_slots = {
+            name: asyncio.Semaphore(limit)
+            for name, limit in (stage_concurrency or {}).items()
+        }
+        self.tasks = deque() # background process() in emitted order
+
+        self.metrics = {self.stage_name(stage): StageMetrics() for stage in self.stages}
 
         # THINK should an optional drop_callback be passed in that gets
         # called if item is dropped in pipeline? Could be the best way
@@ -37,6 +258,8 @@ class Pipeline:
         """
         if pipeline members are strings then load them
         else assure that they're coroutines or class with process_item
+        or process_batch, anything else that's callable runs in an
+        executor
         """
         ret = []
 
@@ -44,11 +267,23 @@ class Pipeline:
             if isinstance(stage, str):
                 stage = load_object(stage)
 
-            if inspect.isclass(stage):
-                assert asyncio.iscoroutinefunction(getattr(stage, 'process_item'))
-                stage = partial(stage().process_item) # instantiate class
-            else:
-                assert asyncio.iscoroutinefunction(stage)
+            if inspect.isclass(stage) and hasattr(stage, 'process_batch'):
+                assert asyncio.iscoroutinefunction(stage.process_batch)
+                stage = BatchStage(stage()) # instantiate class
+            elif inspect.isclass(stage):
+                process_item = getattr(stage, 'process_item')
+
+                if asyncio.iscoroutinefunction(process_item):
+                    stage = partial(stage().process_item) # instantiate class
+                else:
+                    name = stage.__name__
+                    heavy = getattr(stage, 'cpu_bound', False)
+                    stage = SyncStage(stage().process_item, name, heavy)
+
+            elif not asyncio.iscoroutinefunction(stage):
+                assert callable(stage), "%r is not a pipeline stage" % stage
+                name = getattr(stage, '__name__', stage.__class__.__name__)
+                stage = SyncStage(stage, name, getattr(stage, 'cpu_bound', False))
 
             ret.append(stage)
 
@@ -63,7 +298,7 @@ class Pipeline:
             else:
                 return stage.func.__name__
 
-        return stage.__class__.__name__
+        return getattr(stage, '__name__', stage.__class__.__name__)
 
     async def process(self, spider, response, item):
         """
@@ -73,26 +308,146 @@ class Pipeline:
         if item is None:
             return None
 
+        trace = getattr(response, 'trace', None)
+
         for stage in self.stages:
 
+            name = self.stage_name(stage)
+            metrics = self.metrics[name]
+
+            metrics.calls += 1
+            metrics.in_flight += 1
+            start = time.perf_counter()
+
             try:
-                # logger.debug(f"{self.stage_name(stage)} {item}")
-                item = await stage(spider, response, item)
+                # logger.debug(f"{name} {item}")
+                if name in self.stage_slots:
+                    async with self.stage_slots[name]:
+                        item = await stage(spider, response, item)
+                else:
+                    item = await stage(spider, response, item)
 
             except DropItem as e:
-                logger.debug("%s: dropping item: %s", self.stage_name(stage), e)
+                logger.debug("%s: dropping item: %s", name, e)
+                metrics.dropped += 1
                 return None
 
             except DropItemError as e:
-                logger.error("%s: dropping item: %s", self.stage_name(stage), e)
+                logger.error("%s: dropping item: %s", name, e)
+                metrics.errors += 1
                 return None
 
             except Exception as e:
                 # THINK should we really be catching this? If we don't the last
                 # stage of the 1000th item could cause the crawl to fail as we're
                 # deep in the iterweb library vs the client's calling code
-                logger.error("%s: exception: %s", self.stage_name(stage), e)
+                logger.error("%s: exception: %s", name, e)
                 logger.exception(e)
+                metrics.exceptions += 1
                 return None
 
+            finally:
+                metrics.in_flight -= 1
+                metrics.latency.observe(time.perf_counter() - start)
+
+                if trace is not None:
+                    trace.add(name, start, category='pipeline')
+
         return item
+
+    def stats(self):
+        """
+        snapshot of every stage's metrics, {stage_name: {...}}
+        """
+        return {name: metrics.as_dict() for name, metrics in self.metrics.items()}
+
+    def reset_stats(self):
+        for metrics in self.metrics.values():
+            metrics.reset()
+
+    async def submit(self, spider, response, item):
+        """
+        process item in the background, waits if concurrency items are
+        already in the pipeline. Use ready() and drain() to get the results
+        """
+        await self.slots.acquire()
+
+        # the callback is done with response before item is processed
+        if response is not None:
+            response.hold()
+
+        def done(task):
+            self.slots.release()
+            if response is not None:
+                response.release()
+
+        task = asyncio.ensure_future(self.process(spider, response, item))
+        task.add_done_callback(done)
+        self.tasks.append(task)
+
+    def ready(self):
+        """
+        generator of processed items that are ready now
+        """
+        if self.ordered:
+            while self.tasks and self.tasks[0].done():
+                item = self.tasks.popleft().result()
+                if item is not None:
+                    yield item
+            return
+
+        for task in [t for t in self.tasks if t.done()]:
+            self.tasks.remove(task)
+            item = task.result()
+            if item is not None:
+                yield item
+
+    async def drain(self, limit=0):
+        """
+        async generator of every item still in the pipeline, or with a
+        limit just enough of them that no more than limit are left.
+        Items that are processed but not handed out yet count as in it
+        """
+        while len(self.tasks) > limit:
+            if self.ordered:
+                await asyncio.wait([self.tasks[0]])
+            else:
+                await asyncio.wait(self.tasks, return_when=asyncio.FIRST_COMPLETED)
+
+            for item in self.ready():
+                yield item
+
+    def open(self):
+        "a crawl is starting"
+        for stage in self.batch_stages:
+            stage.closing = False
+
+    def close(self):
+        """
+        a crawl is finishing, partial batches get flushed instead of
+        waiting for them to fill up
+        """
+        for stage in self.batch_stages:
+            stage.close()
+
+    def shutdown(self):
+        """
+        shut down the executors we made, sync stages can't run after this
+        """
+        for executor in self.own_executors:
+            executor.shutdown()
+
+    async def cancel(self):
+        """
+        flush partial batches and throw away anything else still
+        in the pipeline
+        """
+        for stage in self.batch_stages:
+            stage.closing = True
+            await stage.flush()
+
+        for task in self.tasks:
+            task.cancel()
+
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks.clear()
@@ -1,46 +1,263 @@
+import re
+import sys
+import codecs
 from urllib.parse import urljoin
 
 import aiohttp.web
 from parsel import Selector
 
-from .utils.reify import reify
 
 import logging
 logger = logging.getLogger(__name__)
 
+charset_re = re.compile(r'charset=["\']?([\w.:-]+)', re.I)
+
+# only look this far into the body for a <meta> charset
+META_SNIFF = 4096
+meta_charset_re = re.compile(rb'<meta[^>]+charset=["\']?([\w.:-]+)', re.I)
+
+BOMS = (
+    (codecs.BOM_UTF8, 'utf-8'),
+    (codecs.BOM_UTF16_LE, 'utf-16-le'),
+    (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
 class Request:
-    def __init__(self, url, *args, **kw):
+    """
+    a url to fetch and what to do with it
+
+    uses __slots__ so a frontier of millions of Requests costs little more
+    than the urls. method, headers, meta and body are only stored when
+    they're given, meta is created the first time it's used.
+    """
+
+    __slots__ = (
+        'url', 'callback', 'priority', 'depth',
+        'host_concurrency', 'host_rate', 'stream', 'attempt',
+        'method', 'headers', 'body', '_meta', 'response_filter',
+    )
+
+    def __init__(self, url, callback=None, priority=0, depth=0,
+                 host_concurrency=None, host_rate=None, stream=False,
+                 method='GET', headers=None, meta=None, body=None, response_filter=None):
         self.url = url
-        self.callback = kw.pop('callback', None)
+        self.callback = callback
+
+        # higher priority gets fetched first by a PriorityFrontier,
+        # depth gets set for us when a callback emits a Request
+        self.priority = priority
+        self.depth = depth
+
+        # override Spider's per host limits, see HostLimiter
+        self.host_concurrency = host_concurrency
+        self.host_rate = host_rate
+
+        # don't read the body, the callback reads it with Response.iter_chunks()
+        self.stream = stream
+
+        # number of times the fetch has been retried
+        self.attempt = 0
+
+        self.method = sys.intern(method.upper())
+        self.headers = headers
+        self.body = body
+        self._meta = meta
+
+        # a ResponseFilter to use instead of the Spider's
+        self.response_filter = response_filter
+
+    @property
+    def meta(self):
+        """
+        a dict for the callback's use, carried along with the Request
+        """
+        if self._meta is None:
+            self._meta = {}
+        return self._meta
+
+    @meta.setter
+    def meta(self, value):
+        self._meta = value
+
+    @classmethod
+    def from_urls(cls, urls, callback=None, priority=0, depth=0):
+        """
+        generator of Requests for an iterable of urls, skips __init__
+        so it's quicker for seeding a big crawl
+        """
+        new = cls.__new__
+
+        for url in urls:
+            request = new(cls)
+            request.url = url
+            request.callback = callback
+            request.priority = priority
+            request.depth = depth
+            request.host_concurrency = None
+            request.host_rate = None
+            request.stream = False
+            request.attempt = 0
+            request.method = 'GET'
+            request.headers = None
+            request.body = None
+            request._meta = None
+            request.response_filter = None
+            yield request
+
+    def __repr__(self):
+        return '<%s %s %s>' % (self.__class__.__name__, self.method, self.url)
+
+def normalize_encoding(name):
+    """
+    python's name for the encoding or None if it isn't one we know
+    """
+    try:
+        return codecs.lookup(name.strip().strip('"\'')).name
+    except (LookupError, AttributeError):
+        return None
+
+def sniff_encoding(headers, body):
+    """
+    the encoding of body going by the Content-Type header, a byte order
+    mark, then a <meta> charset near the top of the document, else utf-8
+    """
+    match = charset_re.search(headers.get('Content-Type', ''))
+    encoding = match and normalize_encoding(match.group(1))
+    if encoding:
+        return encoding
+
+    for bom, encoding in BOMS:
+        if body.startswith(bom):
+            return encoding
+
+    match = meta_charset_re.search(body[:META_SNIFF])
+    encoding = match and normalize_encoding(match.group(1).decode('ascii', 'replace'))
+
+    return encoding or 'utf-8'
+
 
 class Response:
     """
     wrap an aiohttp.ClientResponse with extra functionality
     but pass any getattr to it
+
+    the Selector is built straight from the body bytes, text is only
+    decoded if it's asked for. release() frees the body and the tree.
     """
 
-    def __init__(self, url, response):
+    __slots__ = (
+        'url', 'request', 'status', 'headers',
+        '_response', '_encoding', '_text', '_selector', '_holds', 'trace',
+    )
+
+    def __init__(self, url, response, request=None):
         self.url = url
+        self.request = request
         self._response = response # aiohttp.ClientResponse
+        self.status = response.status
+        self.headers = response.headers
+
+        self._encoding = None
+        self._text = None
+        self._selector = None
+        self._holds = 1
+
+        self.trace = None # set by the Spider if request is being traced
+
+    @property
+    def depth(self):
+        return self.request.depth if self.request else 0
 
     def __getattr__(self, name):
         return getattr(self._response, name)
 
     @property
     def body(self):
-        return self._body
+        return self._response._body
+
+    async def iter_chunks(self, size=64 * 1024):
+        """
+        the body of a streamed Request in chunks of at most size bytes
+
+        async for chunk in response.iter_chunks():
+            pass
+        """
+        async for chunk in self._response.content.iter_chunked(size):
+            yield chunk
+
+    async def save(self, path, size=64 * 1024):
+        """
+        write the body of a streamed Request to path (or file object)
+        without holding it in memory, returns the number of bytes written
+        """
+        written = 0
+        f = open(path, 'wb') if isinstance(path, str) else path
+
+        try:
+            async for chunk in self.iter_chunks(size):
+                f.write(chunk)
+                written += len(chunk)
+        finally:
+            if f is not path:
+                f.close()
+
+        return written
+
+    def hold(self):
+        """
+        keep the body alive past the callback, eg. for an item still in
+        the pipeline. Every hold() needs a matching release()
+        """
+        self._holds += 1
 
-    @reify
+    def release(self):
+        """
+        done with the response, a streamed response's connection is
+        returned to the pool. Called after the callback is finished.
+
+        once everybody holding it has released it, the body, text and
+        Selector are dropped
+        """
+        self._holds -= 1
+
+        if self._holds > 0:
+            return
+
+        self._text = None
+        self._selector = None
+        self._response._body = None
+        self._response.release()
+
+    @property
+    def encoding(self):
+        if self._encoding is None:
+            self._encoding = sniff_encoding(self.headers, self.body or b'')
+        return self._encoding
+
+    @property
     def text(self):
         """
-        convert body (bytes) to a string by using response encoding or utf-8
+        convert body (bytes) to a string using the sniffed encoding
         """
-        # can't use self._response.text as it's a coro, calls the equivalent though
-        return self._body.decode(self._response.get_encoding() or 'utf-8')
+        if self._text is None:
+            self._text = self.body.decode(self.encoding, errors='replace')
+        return self._text
 
-    @reify
+    @property
     def selector(self):
-        return Selector(self.text)
+        if self._selector is None and self.trace is not None:
+            with self.trace.span('selector', bytes=len(self.body or b'')):
+                return self._build_selector()
+
+        return self._build_selector()
+
+    def _build_selector(self):
+        if self._selector is None:
+            if self.body:
+                self._selector = Selector(body=self.body, encoding=self.encoding)
+            else:
+                self._selector = Selector(text=self.text)
+        return self._selector
 
     def xpath(self, query, **kwargs):
         return self.selector.xpath(query, **kwargs)
@@ -48,6 +265,20 @@ class Response:
     def css(self, query):
         return self.selector.css(query)
 
+    def links(self, extractor=None, callback=None, **kw):
+        """
+        Requests for the links in the page, kw are LinkExtractor options
+        or pass in an extractor to reuse one
+
+        for request in response.links(allow=r'/article/', same_domain=True):
+            yield request
+        """
+        if extractor is None:
+            from .links import LinkExtractor
+            extractor = LinkExtractor(**kw)
+
+        return extractor.requests(self, callback=callback)
+
     def urljoin(self, url):
         """
         convert possible relative url to absolute based on request url
@@ -0,0 +1,89 @@
+import random
+import asyncio
+
+import aiohttp
+
+import logging
+logger = logging.getLogger(__name__)
+
+# worth trying again, the server or the network had a bad moment
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class RetryLater(Exception):
+    """
+    raised by Spider.fetch() when a request should be tried
+    again in delay seconds
+    """
+
+    def __init__(self, delay, error=None):
+        super().__init__(delay, error)
+        self.delay = delay
+        self.error = error
+
+
+def is_retryable(error, statuses=RETRY_STATUSES):
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in statuses
+
+    return isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+def retry_after(error):
+    """
+    seconds from a Retry-After header on error, None if there isn't one
+    """
+    headers = getattr(error, 'headers', None) or {}
+
+    try:
+        return max(0.0, float(headers.get('Retry-After')))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    how often and how long to wait before trying a failed fetch again
+
+    the wait is backoff * 2 ** attempt capped at max_backoff, with jitter
+    it's a random amount up to that ("full jitter") so a lot of failed
+    requests don't all come back at the same time. A Retry-After header
+    is honoured up to max_backoff.
+    """
+
+    def __init__(self, retries=3, backoff=0.5, max_backoff=30.0, jitter=True, statuses=RETRY_STATUSES):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.statuses = frozenset(statuses)
+
+    def delay(self, attempt, error):
+        """
+        seconds to wait before retry number attempt (0 based) after
+        error, or None if we should give up
+        """
+        if attempt >= self.retries or not is_retryable(error, self.statuses):
+            return None
+
+        after = retry_after(error)
+        if after is not None:
+            return min(after, self.max_backoff)
+
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+
+        if self.jitter:
+            delay = random.uniform(0, delay)
+
+        return delay
+
+def build_retry(retry):
+    """
+    retry can be None, a number of retries or a RetryPolicy
+    """
+    if retry is None:
+        return RetryPolicy(retries=0)
+
+    if isinstance(retry, int):
+        return RetryPolicy(retries=retry)
+
+    return retry
@@ -0,0 +1,226 @@
+import time
+import asyncio
+
+from .filters import ResponseFiltered
+from .retry import RetryLater
+
+import logging
+logger = logging.getLogger(__name__)
+
+# placeholder result for a request that was parked to retry or was filtered
+SKIP = object()
+
+def body_size(resp):
+    body = getattr(resp, '_body', None)
+    return len(body) if isinstance(body, bytes) else 0
+
+
+class Scheduler:
+    """
+    a fixed number of workers pull Requests off the spider's queue and
+    fetch them. Responses are handed back to the consumer in the order
+    the Requests were taken off the queue, or as they arrive if not ordered.
+
+    workers keep fetching while the consumer is running callbacks, so
+    Requests emitted by a callback get picked up as soon as a worker is
+    free instead of waiting for every other fetch to finish first
+
+    a Request for a host that's at its limit (see HostLimiter) is parked
+    and the worker moves on to the next Request, it's put back on the
+    queue once the host has room for it. A Request that is retried after
+    a backoff (see RetryPolicy) is parked the same way.
+
+    fetched responses wait in a buffer until the consumer gets to them,
+    with max_buffered (responses) or max_buffered_bytes (of bodies) the
+    workers stop taking Requests off the queue while the buffer is full.
+    Fetches already in flight still land, so it can go over by up to
+    max_concurrency responses.
+    """
+
+    def __init__(self, spider, session, max_concurrency, limiter=None, ordered=True,
+                 max_buffered=None, max_buffered_bytes=None):
+        assert max_concurrency > 0, "max_concurrency must be positive"
+
+        self.spider = spider
+        self.session = session
+        self.max_concurrency = max_concurrency
+        self.limiter = limiter
+        self.ordered = ordered
+        self.max_buffered = max_buffered
+        self.max_buffered_bytes = max_buffered_bytes
+
+        self.workers = []
+        self.sleepers = {}  # task: request parked by rate limit or retry
+        self.parked = 0     # waiting on the limiter
+        self.results = {}   # seq -> (request, resp), in arrival order
+        self.pending = 0    # taken off the queue but not yet consumed
+        self.next_seq = 0   # seq given to the next dequeued request
+        self.next_out = 0   # seq the consumer is waiting on
+        self.changed = asyncio.Event()
+
+        self.buffered_bytes = 0 # size of the bodies in results
+        self.drained = asyncio.Event() # consumer took something out of results
+
+    def start(self):
+        loop = self.spider.loop
+
+        for _ in range(self.max_concurrency):
+            self.workers.append(loop.create_task(self._worker()))
+
+    async def stop(self):
+        # a finished sleeper already put its request back
+        unfetched = [request for sleeper, request in self.sleepers.items() if not sleeper.done()]
+
+        for sleeper in list(self.sleepers):
+            sleeper.cancel()
+
+        for worker in self.workers:
+            worker.cancel()
+
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+        # the limiter outlives us, don't leave the next crawl requests
+        # it never dequeued, put them back with the rest of the queue
+        if self.limiter is not None:
+            unfetched.extend(self.limiter.clear())
+
+        for request in unfetched:
+            self.spider.queue.requeue(request)
+
+        # streamed responses that never made it to the consumer
+        for _, resp in self.results.values():
+            if resp is not None and resp is not SKIP and not isinstance(resp, Exception):
+                resp.release()
+
+        self.results = {}
+
+    @property
+    def full(self):
+        if self.max_buffered and len(self.results) >= self.max_buffered:
+            return True
+
+        return bool(self.max_buffered_bytes) and self.buffered_bytes >= self.max_buffered_bytes
+
+    @property
+    def done(self):
+        return self.pending == 0 and self.parked == 0 and self.spider.queue.empty()
+
+    def park(self, request, delay):
+        """
+        hold on to request until its host has room, delay is None when
+        the limiter is holding it for us
+        """
+        self.parked += 1
+
+        if delay is not None:
+            sleeper = self.spider.loop.create_task(self._sleep(request, delay))
+            sleeper.add_done_callback(lambda task: self.sleepers.pop(task, None))
+            self.sleepers[sleeper] = request
+
+    async def _sleep(self, request, delay):
+        await asyncio.sleep(delay)
+        self.unpark(request)
+
+    def unpark(self, request):
+        self.parked -= 1
+        self.spider.queue.requeue(request)
+
+    async def _worker(self):
+        queue = self.spider.queue
+        tracer = self.spider.tracer
+
+        while True:
+            if self.full:
+                self.spider.stats.fetch_pauses += 1
+
+                while self.full:
+                    self.drained.clear()
+                    await self.drained.wait()
+
+            request = await queue.get()
+            trace = tracer.get(request) if tracer is not None else None
+
+            if trace is not None:
+                trace.add('queue', trace.waiting, attempt=request.attempt)
+
+            if self.limiter is not None:
+                delay = self.limiter.acquire(request)
+
+                if delay != 0:
+                    if trace is not None:
+                        trace.waiting = time.perf_counter()
+
+                    self.park(request, delay)
+                    continue
+
+            seq = self.next_seq
+            self.next_seq += 1
+            self.pending += 1
+
+            try:
+                if request.stream:
+                    resp = await self.spider.fetch_stream(self.session, request.url, request.attempt, request)
+                else:
+                    resp = await self.spider.fetch(self.session, request.url, request.attempt, request)
+
+            except RetryLater as e:
+                request.attempt += 1
+                if trace is not None:
+                    trace.waiting = time.perf_counter()
+                self.park(request, e.delay)
+                resp = SKIP
+
+            except ResponseFiltered:
+                self.spider.request_done(request)
+                resp = SKIP
+
+            except Exception as e:
+                # hand it to the consumer so it's raised from crawl()
+                resp = e
+
+            finally:
+                if self.limiter is not None:
+                    waiting = self.limiter.release(request)
+
+                    if waiting is not None:
+                        self.unpark(waiting)
+
+            self.results[seq] = (request, resp)
+            self.buffered_bytes += body_size(resp)
+            self.changed.set()
+
+    async def responses(self):
+        """
+        async generator of (request, resp), resp is None if the fetch failed
+
+        a request only stops counting as pending once the consumer asks
+        for the next response, by then any Requests its callback emitted
+        are already on the queue
+        """
+        while True:
+            if not self.ordered and self.results:
+                self.next_out = next(iter(self.results))
+
+            if self.next_out in self.results:
+                request, resp = self.results.pop(self.next_out)
+                self.next_out += 1
+                self.buffered_bytes -= body_size(resp)
+                self.drained.set()
+
+                if isinstance(resp, Exception):
+                    raise resp
+
+                if resp is SKIP:
+                    self.pending -= 1
+                    continue
+
+                yield request, resp
+                self.pending -= 1
+                continue
+
+            if self.done:
+                return
+
+            self.changed.clear()
+            await self.changed.wait()
@@ -0,0 +1,101 @@
+import aiohttp
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class SessionPool:
+    """
+    a ClientSession with a tuned TCPConnector that lives across crawls so
+    connections, TLS sessions and DNS lookups get reused
+
+    limit: total open connections
+    limit_per_host: open connections to any one host, 0 is unlimited
+    ttl_dns_cache: seconds to remember a DNS lookup
+    keepalive_timeout: seconds to keep an idle connection open
+
+    a Spider makes its own pool, pass the same one to several spiders
+    to share it. close() it (or the Spider) when done
+
+    the connection counters are kept with an aiohttp.TraceConfig, see stats()
+    """
+
+    counters = (
+        'requests',             # sent through the session
+        'connections_created',  # new tcp (+tls) connections
+        'connections_reused',   # requests that went over a kept-alive connection
+        'dns_lookups',          # actually asked the resolver
+        'dns_cache_hits',       # answered from ttl_dns_cache
+    )
+
+    def __init__(self, limit=100, limit_per_host=0, ttl_dns_cache=300, keepalive_timeout=30, **session_kw):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+
+        session_kw.setdefault('headers', {'Connection': 'keep-alive'})
+        self.session_kw = session_kw
+
+        self._session = None
+        self.trace_configs = [] # more aiohttp.TraceConfigs for the session
+
+        for name in self.counters:
+            setattr(self, name, 0)
+
+    def trace_config(self):
+        trace = aiohttp.TraceConfig()
+
+        def counter(name):
+            async def inc(session, context, params):
+                setattr(self, name, getattr(self, name) + 1)
+            return inc
+
+        trace.on_request_start.append(counter('requests'))
+        trace.on_connection_create_end.append(counter('connections_created'))
+        trace.on_connection_reuseconn.append(counter('connections_reused'))
+        trace.on_dns_resolvehost_end.append(counter('dns_lookups'))
+        trace.on_dns_cache_hit.append(counter('dns_cache_hits'))
+
+        return trace
+
+    @property
+    def closed(self):
+        return self._session is None or self._session.closed
+
+    def session(self):
+        """
+        the ClientSession, made the first time it's needed (or after close())
+        so it's bound to the running loop
+        """
+        if self.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.ttl_dns_cache,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                trace_configs=[self.trace_config()] + self.trace_configs,
+                **self.session_kw
+            )
+
+        return self._session
+
+    async def close(self):
+        if not self.closed:
+            await self._session.close()
+        self._session = None
+
+    def stats(self):
+        ret = {name: getattr(self, name) for name in self.counters}
+
+        connections = self.connections_created + self.connections_reused
+        ret['reuse_ratio'] = self.connections_reused / connections if connections else 0.0
+
+        lookups = self.dns_lookups + self.dns_cache_hits
+        ret['dns_hit_ratio'] = self.dns_cache_hits / lookups if lookups else 0.0
+
+        return ret
@@ -0,0 +1,355 @@
+import copy
+import queue
+import asyncio
+import traceback
+import multiprocessing
+from hashlib import blake2b
+
+from .persist import callback_name, resolve_callback
+from .pipeline import Pipeline
+from .reqresp import Request
+from .throttle import url_host
+
+import logging
+logger = logging.getLogger(__name__)
+
+# how long the parent waits on its queue before checking the workers are alive
+POLL = 0.5
+
+# seconds stop() gives the workers to exit before terminating them
+STOP_TIMEOUT = 10.0
+
+
+def shard_for(url, shards):
+    """
+    the shard that owns url's host, stable across processes and runs
+    """
+    digest = blake2b(url_host(url).encode('utf-8', 'surrogateescape'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % shards
+
+def to_wire(request, spider=None):
+    # a bound method would drag the whole spider along, send its name
+    # in a copy, request could be one of the caller's seeds
+    wire = copy.copy(request)
+    wire.callback = callback_name(request.callback, spider)
+    return wire
+
+
+class ShardWorker:
+    """
+    runs in a child process, crawls the Requests it's sent with its
+    own Spider, whose session is kept between crawls, and sends items
+    and other shards' Requests to the parent
+    """
+
+    def __init__(self, index, shards, spider_cls, spider_kw, inbox, outbox):
+        self.index = index
+        self.shards = shards
+        self.spider_cls = spider_cls
+        self.spider_kw = spider_kw
+        self.inbox = inbox
+        self.outbox = outbox
+        self.received = 0 # Requests taken from inbox
+        self.failed = False # sent an error already
+
+    def route(self, request):
+        shard = shard_for(request.url, self.shards)
+
+        if shard == self.index:
+            return False
+
+        self.outbox.put(('request', shard, to_wire(request, self.spider)))
+        return True
+
+    def accept(self, request):
+        self.received += 1
+        request.callback = resolve_callback(self.spider, request.callback)
+        return request
+
+    async def read(self, local):
+        """
+        move messages from the multiprocessing inbox to an asyncio.Queue
+
+        the get() times out so the executor thread comes back soon after
+        we're cancelled, asyncio.run() waits for it before returning
+        """
+        loop = asyncio.get_running_loop()
+
+        while True:
+            try:
+                msg = await loop.run_in_executor(None, self.inbox.get, True, POLL)
+            except queue.Empty:
+                continue
+
+            await local.put(msg)
+
+            if msg is None:
+                return
+
+    async def feed(self, local, crawling):
+        """
+        enqueue Requests that arrive while a crawl is running, cancel
+        the crawl if we're told to stop
+        """
+        while True:
+            msg = await local.get()
+
+            if msg is None:
+                local.put_nowait(None) # let run() see it too
+                crawling.cancel()
+                return
+
+            await self.spider.enqueue(self.accept(msg))
+
+    async def crawl(self, requests):
+        async for item in self.spider.crawl(requests):
+            self.outbox.put(('item', self.index, item))
+
+    async def run(self):
+        self.spider = self.spider_cls(route=self.route, **self.spider_kw)
+        local = asyncio.Queue()
+        reader = asyncio.ensure_future(self.read(local))
+
+        try:
+            while True:
+                msg = await local.get()
+
+                if msg is None:
+                    break
+
+                requests = [self.accept(msg)]
+
+                # requests that arrive after the crawl decided it was
+                # finished are still in the spider's queue, go again
+                while requests or not self.spider.queue.empty():
+                    crawling = asyncio.ensure_future(self.crawl(requests))
+                    feeder = asyncio.ensure_future(self.feed(local, crawling))
+
+                    try:
+                        await asyncio.wait([crawling])
+                    finally:
+                        feeder.cancel()
+
+                    if crawling.cancelled():
+                        break # feed() left the None for us
+
+                    crawling.result() # raise what the crawl raised
+                    requests = []
+
+                # everything this shard sent is ahead of this in outbox
+                self.outbox.put(('idle', self.index, self.received))
+
+        except Exception:
+            # tell the parent before tearing down, which could take a while
+            self.outbox.put(('error', self.index, traceback.format_exc()))
+            self.failed = True
+            raise
+
+        finally:
+            reader.cancel()
+            self.outbox.put(('stats', self.index, self.spider.stats.as_dict()))
+            await self.spider.close()
+
+def run_shard(*args):
+    """
+    multiprocessing target
+    """
+    worker = ShardWorker(*args)
+
+    try:
+        asyncio.run(worker.run())
+    except BaseException:
+        if not worker.failed:
+            worker.outbox.put(('error', worker.index, traceback.format_exc()))
+        raise
+
+
+class ShardedRunner:
+    """
+    crawl with shards processes, each running its own spider_cls(**spider_kw)
+    and ClientSession. Every host belongs to one shard, a Request for
+    a host owned by another shard is sent there through this process
+
+    pipeline_in is 'worker' to run spider_kw['pipeline'] in the shards
+    or 'parent' to run it here on the merged items, a parent stage gets
+    the runner as spider and None as response
+
+    spider_cls and everything in spider_kw must be picklable, as must
+    the items. Request callbacks are sent by name, see DiskFrontier
+
+    runner = ShardedRunner(MySpider, shards=4, max_concurrency=32)
+
+    async for item in runner.crawl(seeds):
+        pass
+    """
+
+    def __init__(self, spider_cls, shards=None, pipeline_in='worker', context='spawn', **spider_kw):
+        assert pipeline_in in ('worker', 'parent'), "pipeline_in must be worker or parent"
+
+        self.spider_cls = spider_cls
+        self.shards = shards or multiprocessing.cpu_count()
+        self.context = multiprocessing.get_context(context)
+        self.spider_kw = spider_kw
+
+        self.pipeline = None
+        if pipeline_in == 'parent':
+            stages = spider_kw.pop('pipeline', [])
+            self.pipeline = stages if isinstance(stages, Pipeline) else Pipeline(stages)
+
+        self.stats = {} # shard index: Spider.stats.as_dict(), after a crawl
+
+    def start(self):
+        self.outbox = self.context.Queue()
+        self.inboxes = [self.context.Queue() for _ in range(self.shards)]
+
+        self.processes = [
+            self.context.Process(
+                target=run_shard,
+                args=(i, self.shards, self.spider_cls, self.spider_kw, inbox, self.outbox),
+                daemon=True,
+            )
+            for i, inbox in enumerate(self.inboxes)
+        ]
+
+        for process in self.processes:
+            process.start()
+
+    async def stop(self, timeout=STOP_TIMEOUT):
+        """
+        tell the workers to stop, in the middle of a crawl or not, and
+        collect their stats. Workers still running after timeout seconds
+        are terminated
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        for inbox in self.inboxes:
+            inbox.put(None)
+
+        # collect the final stats while waiting for the workers to exit,
+        # whatever else they sent is thrown away
+        while len(self.stats) < self.shards and any(p.is_alive() for p in self.processes):
+            if loop.time() >= deadline:
+                break
+
+            try:
+                msg = await loop.run_in_executor(None, self.outbox.get, True, POLL)
+            except queue.Empty:
+                continue
+
+            if msg[0] == 'stats':
+                self.stats[msg[1]] = msg[2]
+
+        for i, process in enumerate(self.processes):
+            await loop.run_in_executor(None, process.join, max(POLL, deadline - loop.time()))
+
+            if process.is_alive():
+                logger.warning("shard %d didn't stop, terminating it", i)
+                process.terminate()
+
+    def send(self, request):
+        shard = shard_for(request.url, self.shards)
+        self.inboxes[shard].put(to_wire(request))
+        self.sent[shard] += 1
+
+    async def receive(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            try:
+                return await loop.run_in_executor(None, self.outbox.get, True, POLL)
+            except queue.Empty:
+                pass
+
+            for i, process in enumerate(self.processes):
+                if not process.is_alive():
+                    raise RuntimeError("shard %d died with exit code %s" % (i, process.exitcode))
+
+    async def process(self, item):
+        """
+        async generator of the parent pipeline's processed items that
+        are ready after item goes in, like Spider.handle_response()
+        """
+        pipeline = self.pipeline
+
+        if pipeline.concurrency > 1:
+            limit = self.spider_kw.get('max_pending_items') or 4 * pipeline.concurrency
+
+            async for processed in pipeline.drain(limit - 1):
+                yield processed
+
+            await pipeline.submit(self, None, item)
+
+            for processed in pipeline.ready():
+                yield processed
+
+        else:
+            item = await pipeline.process(self, None, item)
+
+            if item is not None:
+                yield item
+
+    async def crawl(self, requests):
+        """
+        async generator of the items from every shard, in no particular
+        order. requests is a url, a Request or an iterable of either
+        """
+        if isinstance(requests, (str, Request)):
+            requests = [requests]
+
+        self.sent = [0] * self.shards # Requests sent to each shard
+        self.idle = [0] * self.shards # Requests received when it went idle
+        self.stats = {}
+
+        self.start()
+
+        if self.pipeline is not None:
+            self.pipeline.open()
+
+        try:
+            for request in requests:
+                if not isinstance(request, Request):
+                    request = Request(request)
+                self.send(request)
+
+            # a shard is finished when it has gone idle after receiving
+            # everything sent to it, and anything it sent out is ahead
+            # of its idle message so once every shard is finished we're done
+            while self.idle != self.sent:
+                kind, index, payload = await self.receive()
+
+                if kind == 'item':
+                    if self.pipeline is None:
+                        yield payload
+                        continue
+
+                    async for item in self.process(payload):
+                        yield item
+
+                elif kind == 'request':
+                    self.send(payload)
+
+                elif kind == 'idle':
+                    self.idle[index] = payload
+
+                elif kind == 'error':
+                    raise RuntimeError("shard %d failed:\n%s" % (index, payload))
+
+                elif kind == 'stats':
+                    # a shard only sends its stats when it exits, stop()
+                    # hasn't asked it to so it gave up part way through
+                    self.stats[index] = payload
+                    raise RuntimeError("shard %d exited before it was finished" % index)
+
+            if self.pipeline is not None:
+                self.pipeline.close()
+
+                async for item in self.pipeline.drain():
+                    yield item
+
+        finally:
+            if self.pipeline is not None:
+                self.pipeline.close()
+                await self.pipeline.cancel()
+
+            await self.stop()
@@ -1,12 +1,24 @@
 from functools import partial
 import inspect
 import asyncio
+import time
 
 import aiohttp
-import aiohttp.client_exceptions
 
+from .contentfilter import build_content_filter
+from .dupefilter import build_dupefilter
+from .filters import ResponseFilter, ResponseFiltered
+from .frontier import build_frontier
+from .httpcache import HttpCache
+from .offload import build_executor, is_pure, offload
 from .pipeline import Pipeline
 from .reqresp import Request, Response
+from .retry import RetryLater, build_retry, is_retryable
+from .scheduler import Scheduler
+from .session import SessionPool
+from .stats import CrawlStats
+from .throttle import HostLimiter
+from .tracing import ChromeTraceSink, Tracer, traced
 
 import logging
 logger = logging.getLogger(__name__)
@@ -19,6 +31,23 @@ def is_async(func):
         func = func.func
     return inspect.isasyncgenfunction(func) or asyncio.iscoroutinefunction(func)
 
+def request_kw(request):
+    """
+    session.request() keywords for request's headers and body
+    """
+    kw = {}
+
+    if request is None:
+        return kw
+
+    if request.headers:
+        kw['headers'] = request.headers
+
+    if request.body is not None:
+        kw['data'] = request.body
+
+    return kw
+
 
 class Spider:
     """
@@ -30,67 +59,381 @@ class Spider:
         """
         optional kw:
         loop: event loop
-        pipeline: pass emitted items to pipeline
+        pipeline: pass emitted items to pipeline, a list of stages or a Pipeline
         track_urls: defaults to True, don't crawl the same page twice
+        dupefilter: how urls are tracked, one of set, fingerprint, bloom
+                    or a DupeFilter, defaults to set
+        content_filter: skip pages whose body was already seen, hash for
+                        identical bodies, simhash for near duplicates or
+                        a ContentFilter, defaults to None
         parse_func: the callback after crawling a page, defaults to self.parse
                     or set callback in Request object
+        max_concurrency: number of fetch workers, defaults to 16
+        host_concurrency: max in-flight requests per host, defaults to unlimited
+        host_rate: max requests per second per host, defaults to unlimited
+        host_burst: how many requests a host can get at once under host_rate
+        breaker_threshold: stop sending requests to a host after this many
+                           failures in a row, defaults to never
+        breaker_cooldown: seconds to leave a failing host alone, defaults to 30
+        timeout: seconds (or an aiohttp.ClientTimeout) before giving up on a
+                 fetch, defaults to the session's timeout
+        retry: number of retries (or a RetryPolicy) for timeouts, connection
+               errors and statuses like 503, defaults to no retries
+        frontier: crawl order, one of fifo (bfs), lifo (dfs), priority or
+                  a Frontier, defaults to fifo. Use a DiskFrontier to be
+                  able to resume a crawl
+        max_depth: drop Requests deeper than this, seeds are depth 0
+        http_cache: directory (or an HttpCache) to cache responses in,
+                    defaults to no caching
+        executor: number of processes (or an Executor) to run @pure
+                  callbacks in, defaults to running them on the loop
+        stats_interval: log self.stats every this many seconds while crawling
+        max_buffered_responses: stop fetching while this many responses
+                                are waiting on the consumer, defaults
+                                to 4 * max_concurrency
+        max_buffered_bytes: stop fetching while the waiting responses'
+                            bodies add up to this, defaults to unlimited
+        max_pending_items: hand out pipeline results before submitting
+                           more items once this many are in a concurrent
+                           pipeline, defaults to 4 * its concurrency
+        content_types: only read responses of these types, eg. text/html
+                       or text/*, defaults to any
+        max_size: only read responses up to this many bytes
+        header_filter: header_filter(headers) returns False to not read
+                       a response, a Request's response_filter overrides
+                       all three
+        tracer: a Tracer, or a path to write a Chrome trace to, records
+                where each Request's time went. Defaults to None
+        trace_sample: fraction of Requests to trace when tracer is a path
+        session_pool: the SessionPool crawl() uses when it isn't given a
+                      client, share one between spiders, defaults to a
+                      SessionPool(limit=max_concurrency) of our own
 
         any other keywords are set as attributes on self
         """
-        self.queue = asyncio.Queue()
-
         self.loop = kw.pop('loop', asyncio.get_event_loop())
+
+        self.queue = build_frontier(
+            kw.pop('frontier', 'fifo'),
+            kw.pop('max_depth', None),
+        )
         self.callback = kw.pop('parse_func', self.parse)
 
+        # function: one bound method of it, only our own methods
+        self.callbacks = {}
+        if getattr(self.callback, '__self__', None) is self:
+            self.callbacks[self.callback.__func__] = self.callback
+
         stages = kw.pop('pipeline', [])
-        self.pipeline = Pipeline(stages)
+        self.pipeline = stages if isinstance(stages, Pipeline) else Pipeline(stages)
 
         # this is a bit of a misnomer, we only track at enqueuing time
         # and success/failure or ultimate fetch is not taken into account
         self.track_urls = kw.pop('track_urls', True)
-        self.visted_urls = set() # probably visited
+        self.dupefilter = build_dupefilter(kw.pop('dupefilter', 'set'))
+        self.content_filter = build_content_filter(kw.pop('content_filter', None))
+
+        self.max_concurrency = kw.pop('max_concurrency', 16)
+        self.max_buffered_responses = kw.pop('max_buffered_responses', 4 * self.max_concurrency)
+        self.max_buffered_bytes = kw.pop('max_buffered_bytes', None)
+        self.max_pending_items = kw.pop('max_pending_items', None)
+        self.session_pool = kw.pop('session_pool', None) or SessionPool(limit=self.max_concurrency)
+
+        self.limiter = HostLimiter(
+            concurrency=kw.pop('host_concurrency', None),
+            rate=kw.pop('host_rate', None),
+            burst=kw.pop('host_burst', 1),
+            breaker_threshold=kw.pop('breaker_threshold', None),
+            breaker_cooldown=kw.pop('breaker_cooldown', 30.0),
+        )
+
+        timeout = kw.pop('timeout', None)
+        if isinstance(timeout, (int, float)):
+            timeout = aiohttp.ClientTimeout(total=timeout)
+        self.timeout = timeout
+
+        self.response_filter = ResponseFilter(
+            content_types=kw.pop('content_types', None),
+            max_size=kw.pop('max_size', None),
+            predicate=kw.pop('header_filter', None),
+        )
+
+        self.retry = build_retry(kw.pop('retry', None))
+
+        http_cache = kw.pop('http_cache', None)
+        if isinstance(http_cache, str):
+            http_cache = HttpCache(http_cache)
+        self.http_cache = http_cache
+
+        executor = kw.pop('executor', None)
+        self.executor = build_executor(executor)
+        self.own_executor = self.executor is not executor # shut down in close()
+
+        self.stats = CrawlStats(self)
+        self.stats_interval = kw.pop('stats_interval', None)
+
+        tracer = kw.pop('tracer', None)
+        trace_sample = kw.pop('trace_sample', 1.0)
+        if isinstance(tracer, str):
+            tracer = Tracer(ChromeTraceSink(tracer), sample=trace_sample)
+        self.tracer = tracer
+
+        if tracer is not None:
+            self.session_pool.trace_configs.append(tracer.trace_config())
+
+        # route(request) returns True if it took the request elsewhere
+        self.route = kw.pop('route', None)
 
         # let caller put arbitrary attributes in us, be careful about
         # overriding something important
         for name, value in kw.items():
             setattr(self, name, value)
 
+    @property
+    def visted_urls(self):
+        "probably visited, kept for backwards compatibility"
+        return self.dupefilter
+
     async def parse(self, response):
         raise NotImplementedError("%s().parse() not implemented" % self.__class__.__name__)
 
     async def enqueue(self, requests):
+        """
+        requests is a url, a Request or an iterable of either, use
+        Request.from_urls() for a quick start on lots of urls
+        """
         if not requests:
             return
 
-        if not isinstance(requests, list):
+        if isinstance(requests, (str, Request)):
             requests = [requests]
 
+        callbacks = self.callbacks
+
         for request in requests:
             # convert url string to a Request
             if not isinstance(request, Request):
                 request = Request(request, callback=self.callback)
 
-            if self.track_urls:
-                if request.url in self.visted_urls:
-                    continue
-                else:
-                    self.visted_urls.add(request.url)
+            elif getattr(request.callback, '__self__', None) is self:
+                # self.parse_page makes a new bound method every time,
+                # keep one of each so a big frontier doesn't hold millions.
+                # Anything else (a partial, a lambda) would be kept alive
+                # by us along with whatever it captured
+                callback = request.callback
+                request.callback = callbacks.setdefault(callback.__func__, callback)
+
+            if self.track_urls and self.dupefilter.seen(request.url):
+                self.stats.requests_duplicate += 1
+                continue
 
+            # another process owns request's host, see ShardedRunner,
+            # after the dupefilter so a link on every page goes once
+            if self.route is not None and self.route(request):
+                continue
+
+            self.stats.requests_enqueued += 1
+
+            dropped = self.queue.dropped
             await self.queue.put(request)
 
-    async def fetch(self, session, url):
+            # a Request the frontier dropped (max_depth) would never finish
+            if self.tracer is not None and self.queue.dropped == dropped:
+                self.tracer.start(request)
+
+    async def fetch(self, session, url, attempt=0, request=None):
         """
         return resp with populated body or None if error
+
+        raises RetryLater if the fetch failed but should be tried again,
+        attempt is how many times it's been retried already. request
+        supplies the method, headers and body, defaults to a plain GET
+
+        with an http_cache a fresh cached response is returned without
+        asking the server and a stale one is revalidated
+
+        raises ResponseFiltered if the response filter refused it, the
+        body isn't read
         """
+        cached = None
+        method = request.method if request is not None else 'GET'
+        kw = request_kw(request)
+        headers = dict(kw.pop('headers', {}))
+        trace = self.trace(request)
+
+        if self.timeout:
+            kw['timeout'] = self.timeout
+
+        if trace is not None:
+            kw['trace_request_ctx'] = trace
+
+        if self.http_cache is not None and method == 'GET' and 'data' not in kw:
+            cached = self.http_cache.lookup(url)
+
+            if cached is not None and cached.fresh:
+                self.http_cache.hits += 1
+                if trace is not None:
+                    trace.add('cache_hit', time.perf_counter())
+                return cached
+
+            if cached is not None:
+                headers.update(cached.validators())
+
+        stats = self.stats
+        stats.in_flight += 1
+        start = time.perf_counter()
+
         try:
-            async with session.get(url) as resp:
+            async with session.request(method, url, headers=headers, **kw) as resp:
+                stats.status[resp.status] += 1
+
+                if resp.status == 304 and cached is not None:
+                    self.http_cache.revalidated += 1
+                    stats.pages_fetched += 1
+                    self.limiter.success(url)
+                    return self.http_cache.refresh(cached, resp.headers)
+
                 resp.raise_for_status()
-                resp._body = await resp.read() # set coro with value, this is allowed
-                resp.close()                   # not a coroutine
+
+                response_filter = self.filter_headers(url, request, resp)
+                download = time.perf_counter()
+                resp._body = await response_filter.read(resp) # set coro with value, this is allowed
+                resp.close()                                  # not a coroutine
+
+                if trace is not None:
+                    trace.add('download', download, bytes=len(resp._body))
+
+                stats.pages_fetched += 1
+                stats.bytes_downloaded += len(resp._body)
+                self.limiter.success(url)
+
+                if self.http_cache is not None and method == 'GET' and 'data' not in kw:
+                    self.http_cache.misses += 1
+                    self.http_cache.store(url, resp)
+
                 return resp
 
-        except (aiohttp.ClientResponseError, aiohttp.client_exceptions.ClientError) as e:
-            logger.error("url: %s: error: %s", url, e)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.fetch_failed(url, attempt, e)
+
+        except ResponseFiltered as e:
+            self.fetch_filtered(url, e)
+            raise
+
+        finally:
+            stats.in_flight -= 1
+            stats.fetch_latency.observe(time.perf_counter() - start)
+
+            if trace is not None:
+                trace.add('fetch', start, attempt=attempt)
+
+        return None
+
+    def trace(self, request):
+        "the Trace for request if it's being traced, else None"
+        if self.tracer is None or request is None:
+            return None
+        return self.tracer.get(request)
+
+    def request_done(self, request):
+        """
+        request has been dealt with, one way or another
+        """
+        self.queue.finished(request)
+
+        if self.tracer is not None:
+            self.tracer.finish(request)
+
+    def filter_headers(self, url, request, resp):
+        """
+        return the ResponseFilter for request or close resp and raise
+        ResponseFiltered if its headers are refused
+        """
+        response_filter = self.response_filter
+
+        if request is not None and request.response_filter is not None:
+            response_filter = request.response_filter
+
+        reason = response_filter.refuse(resp.headers)
+
+        if reason is not None:
+            resp.close() # drop the connection rather than read the rest
+            raise ResponseFiltered(reason)
+
+        return response_filter
+
+    def fetch_filtered(self, url, error):
+        logger.info("url: %s: filtered: %s", url, error)
+        self.stats.pages_filtered += 1
+        self.limiter.success(url)
+
+    def fetch_failed(self, url, attempt, error):
+        """
+        record the failure, raise RetryLater if the retry policy says so
+        """
+        if is_retryable(error):
+            self.limiter.failure(url)
+        elif isinstance(error, aiohttp.ClientResponseError):
+            # the host answered, it's up even if the page isn't there
+            self.limiter.success(url)
+
+        delay = self.retry.delay(attempt, error)
+
+        if delay is not None:
+            logger.warning("url: %s: error: %s, retrying in %.2fs", url, error or type(error).__name__, delay)
+            self.stats.retries += 1
+            raise RetryLater(delay, error)
+
+        logger.error("url: %s: error: %s", url, error or type(error).__name__)
+        self.stats.fetch_errors += 1
+
+    async def fetch_stream(self, session, url, attempt=0, request=None):
+        """
+        return resp with the body unread or None if error, the connection
+        stays open until the response is released
+
+        only the headers are checked by the response filter, the callback
+        has to keep an eye on the size
+        """
+        stats = self.stats
+        stats.in_flight += 1
+        start = time.perf_counter()
+        resp = None
+        method = request.method if request is not None else 'GET'
+        kw = request_kw(request)
+        trace = self.trace(request)
+
+        if self.timeout:
+            kw['timeout'] = self.timeout
+
+        if trace is not None:
+            kw['trace_request_ctx'] = trace
+
+        try:
+            resp = await session.request(method, url, **kw)
+            stats.status[resp.status] += 1
+            resp.raise_for_status()
+            self.filter_headers(url, request, resp)
+            stats.pages_fetched += 1
+            self.limiter.success(url)
+            return resp
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if resp is not None:
+                resp.release()
+
+            self.fetch_failed(url, attempt, e)
+
+        except ResponseFiltered as e:
+            self.fetch_filtered(url, e)
+            raise
+
+        finally:
+            stats.in_flight -= 1
+            stats.fetch_latency.observe(time.perf_counter() - start)
+
+            if trace is not None:
+                trace.add('fetch', start, attempt=attempt, stream=True)
 
         return None
 
@@ -100,12 +443,12 @@ class Spider:
         useful if self.parse() and/or pipeline do work and
         you don't care what's "returned" from a crawl
 
-        eg. await spider.exhaust(urls)
+        eg. await spider.exhaust(urls, ordered=False)
         """
         async for _ in self.crawl(*args, **kw):
             pass
 
-    async def crawl(self, requests, client=None):
+    async def crawl(self, requests, client=None, ordered=True, resume=False):
         """
         main function, this is an async generator, must "call" with a for loop
 
@@ -116,69 +459,114 @@ class Spider:
         is sent to the pipeline. The result of the pipeline is returned
 
         request: str or Request
-        client: an aiohttp.ClientSession or similar duck
+        client: an aiohttp.ClientSession or similar duck, defaults to
+                self.session_pool's session. It's left open either way
+        ordered: if False then responses are handled as soon as they
+                 arrive instead of in the order they were queued
+        resume: continue a crawl that was killed, requires a frontier
+                that saves its state like DiskFrontier
         """
-        try:
-            if client is None:
-                client = aiohttp.ClientSession(
-                    loop=self.loop,
-                    headers={'Connection': 'keep-alive'}
-                )
-                close_client = True
-            else:
-                close_client = False
+        if client is None:
+            client = self.session_pool.session()
 
-            async for item in self._crawl(requests, client):
-                yield item
+        # close _crawl explicitly so its cleanup runs as soon as we're
+        # closed instead of whenever the loop gets around to it
+        crawler = self._crawl(requests, client, ordered, resume)
 
+        try:
+            async for item in crawler:
+                yield item
         finally:
-            if close_client and not client.closed:
-                await client.close()
+            await crawler.aclose()
 
-    async def _crawl(self, requests, client):
+    async def close(self):
+        """
+        close our session pool, only needed if crawl() was called
+        without a client, the tracer and the executors we (or our
+        pipeline) made
+        """
+        await self.session_pool.close()
+
+        if self.own_executor:
+            self.executor.shutdown()
+
+        self.pipeline.shutdown()
+
+        if self.tracer is not None:
+            self.tracer.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _crawl(self, requests, client, ordered=True, resume=False):
         """
         the workhorse function
 
-        enqueue the requests then keep processing the queue
-        until it's empty bearing in mind new requests can get
-        enqueued at any time
+        enqueue the requests then let a fixed pool of workers keep
+        fetching from the queue until it's empty and nothing is in
+        flight, bearing in mind new requests can get enqueued at any time
         """
 
+        self.queue.start(self, resume)
+        self.pipeline.open()
         await self.enqueue(requests)
+        complete = False
 
-        async with client as session:
+        scheduler = Scheduler(
+            self, client, self.max_concurrency, self.limiter, ordered,
+            self.max_buffered_responses, self.max_buffered_bytes,
+        )
+        scheduler.start()
 
-            while not self.queue.empty():
-                tasks = []
-                requests = []
+        if self.stats_interval:
+            stats_logger = self.loop.create_task(self.stats.log_every(self.stats_interval))
 
-                # empty the queue to start all fetches, any callback
-                # may add to the queue to keep outer loop going
-                while not self.queue.empty():
-                    request = await self.queue.get()
+        try:
+            async for request, resp in scheduler.responses():
+                if resp is None:
+                    logger.error("can not proceed with: %s", request.url)
+                    self.request_done(request)
+                    continue
 
-                    task = self.loop.create_task(
-                        self.fetch(session, request.url)
-                    )
+                resp = Response(request.url, resp, request)
+                resp.trace = self.trace(request)
+                callback = request.callback or self.callback
 
-                    tasks.append(task)
-                    requests.append(request)
+                # I've forgetten the async keyword too many times
+                assert is_async(callback) or is_pure(callback), f"{callback.__name__} must be async"
 
-                for request, task in zip(requests, tasks):
-                    resp = await task
+                try:
+                    async for item in self.handle_response(callback, resp):
+                        self.stats.items_yielded += 1
+                        yield item
+                finally:
+                    resp.release()
 
-                    if resp is None:
-                        logger.error("can not proceed with: %s", request.url)
-                        continue
+                self.request_done(request)
 
-                    resp = Response(request.url, resp)
-                    callback = request.callback or self.callback
+            self.pipeline.close()
 
-                    # I've forgetten the async keyword too many times
-                    assert is_async(callback), f"{callback.__name__} must be async"
+            async for item in self.pipeline.drain():
+                self.stats.items_yielded += 1
+                yield item
 
-                    async for item in self.handle_response(callback, resp):
-                        yield item
+            complete = True
+
+        finally:
+            if self.stats_interval:
+                stats_logger.cancel()
+                self.stats.log()
+
+            await scheduler.stop()
+            await self.pipeline.cancel()
+
+            if self.tracer is not None:
+                self.tracer.flush()
+
+            self.queue.close(complete)
 
     async def handle_response(self, callback, response):
         """
@@ -187,22 +575,55 @@ class Spider:
 
         start another request if we receive a Request, this is how
         a site can get crawled
+
+        with a content_filter a page we've already seen under another
+        url is skipped, neither callback nor pipeline see it
         """
+        if self.content_filter is not None and response.body is not None:
+            if self.content_filter.seen(response):
+                logger.debug("duplicate content: %s", response.url)
+                self.stats.pages_duplicate += 1
+                return
+
         async def convert_to_generator(callback, response):
             yield await callback(response)
 
+        # a pure callback runs in our executor, or inline if it's not async
+        if is_pure(callback) and (self.executor is not None or not is_async(callback)):
+            callback = partial(offload, self.executor, callback)
+
         # if the callback is not a generator, then convert it
         # to one so that we can use it in the loop below
-        if not inspect.isasyncgenfunction(callback):
+        elif not inspect.isasyncgenfunction(callback):
             callback = partial(convert_to_generator, callback)
 
-        async for item in callback(response):
+        items = callback(response)
+
+        if response.trace is not None:
+            items = traced(response.trace, 'callback', items)
+
+        async for item in items:
             if item is None:
                 continue
 
             elif isinstance(item, Request):
+                self.stats.requests_emitted += 1
+                item.depth = response.depth + 1
                 await self.enqueue(item)
 
+            elif self.pipeline.concurrency > 1:
+                # an ordered pipeline keeps finished items behind a slow
+                # one, hand them out before they pile up
+                limit = self.max_pending_items or 4 * self.pipeline.concurrency
+
+                async for processed in self.pipeline.drain(limit - 1):
+                    yield processed
+
+                await self.pipeline.submit(self, response, item)
+
+                for item in self.pipeline.ready():
+                    yield item
+
             else:
                 item = await self.pipeline.process(self, response, item)
 
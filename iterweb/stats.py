@@ -0,0 +1,144 @@
+import time
+import asyncio
+from collections import Counter
+
+import aiohttp.web
+
+from .utils import Histogram
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class CrawlStats:
+    """
+    counters for a spider, updated as it crawls. Export with as_dict(),
+    log(), prometheus() or serve() them over http for scraping
+
+    the queue depth is read from the spider when exported
+    """
+
+    counters = (
+        'requests_enqueued',  # made it past the dupefilter
+        'requests_duplicate', # dropped by the dupefilter
+        'pages_fetched',      # got a response
+        'pages_duplicate',    # content already seen, see Spider.content_filter
+        'pages_filtered',     # refused by the response filter, not read
+        'fetch_errors',       # no response
+        'retries',            # fetches that will be tried again
+        'bytes_downloaded',   # response bodies, streamed bodies aren't counted
+        'items_yielded',      # made it out of the pipeline
+        'requests_emitted',   # Requests yielded by callbacks
+        'fetch_pauses',       # fetching waited for the consumer to catch up
+    )
+
+    def __init__(self, spider):
+        self.spider = spider
+        self.reset()
+
+    def reset(self):
+        for name in self.counters:
+            setattr(self, name, 0)
+
+        self.in_flight = 0
+        self.status = Counter()
+        self.fetch_latency = Histogram()
+        self.started = time.monotonic()
+
+    @property
+    def queue_depth(self):
+        return self.spider.queue.qsize()
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.started
+
+        ret = {name: getattr(self, name) for name in self.counters}
+        ret.update({
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'status': dict(self.status),
+            'fetch_latency': self.fetch_latency.as_dict(),
+            'connections': self.spider.session_pool.stats(),
+            'elapsed': elapsed,
+            'pages_per_second': self.pages_fetched / elapsed if elapsed else 0.0,
+        })
+
+        return ret
+
+    def log(self, level=logging.INFO):
+        logger.log(
+            level,
+            "pages: %d (%.1f/s) errors: %d items: %d bytes: %d in flight: %d queued: %d p50: %.3fs p99: %.3fs",
+            self.pages_fetched,
+            self.as_dict()['pages_per_second'],
+            self.fetch_errors,
+            self.items_yielded,
+            self.bytes_downloaded,
+            self.in_flight,
+            self.queue_depth,
+            self.fetch_latency.percentile(50),
+            self.fetch_latency.percentile(99),
+        )
+
+    async def log_every(self, interval, level=logging.INFO):
+        """
+        log a line every interval seconds until cancelled
+        """
+        while True:
+            await asyncio.sleep(interval)
+            self.log(level)
+
+    def prometheus(self, prefix='iterweb'):
+        """
+        the stats in prometheus text exposition format
+        """
+        lines = []
+
+        def metric(name, kind, value, labels=''):
+            if kind:
+                lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+            lines.append('%s_%s%s %s' % (prefix, name, labels, value))
+
+        for name in self.counters:
+            metric(name + '_total', 'counter', getattr(self, name))
+
+        for name, value in self.spider.session_pool.stats().items():
+            if not name.endswith('_ratio'):
+                metric(name + '_total', 'counter', value)
+
+        metric('in_flight', 'gauge', self.in_flight)
+        metric('queue_depth', 'gauge', self.queue_depth)
+
+        lines.append('# TYPE %s_responses_total counter' % prefix)
+        for status, count in sorted(self.status.items()):
+            metric('responses_total', None, count, '{status="%s"}' % status)
+
+        latency = self.fetch_latency.as_dict()
+        lines.append('# TYPE %s_fetch_seconds histogram' % prefix)
+        for bound, count in latency['buckets'].items():
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            metric('fetch_seconds_bucket', None, count, '{le="%s"}' % le)
+        metric('fetch_seconds_sum', None, latency['sum'])
+        metric('fetch_seconds_count', None, latency['count'])
+
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, host='127.0.0.1', port=9100, path='/metrics'):
+        """
+        serve prometheus() on http://host:port/path, returns the
+        aiohttp.web.AppRunner, call its cleanup() to stop serving
+        """
+        async def metrics(request):
+            return aiohttp.web.Response(
+                body=self.prometheus().encode('utf-8'),
+                headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'},
+            )
+
+        app = aiohttp.web.Application()
+        app.router.add_get(path, metrics)
+
+        runner = aiohttp.web.AppRunner(app)
+        await runner.setup()
+        await aiohttp.web.TCPSite(runner, host, port).start()
+
+        return runner
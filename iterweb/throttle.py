@@ -0,0 +1,209 @@
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def url_host(url):
+    """
+    the host:port part of url, relative urls all share the '' host
+    """
+    return urlsplit(url).netloc.lower()
+
+
+class TokenBucket:
+    """
+    classic token bucket, refills at rate tokens per second up to burst
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def consume(self, rate=None):
+        """
+        take a token and return 0, or reserve the next one and return
+        how many seconds until it's ours. tokens goes negative so every
+        caller gets its own turn instead of all waking at once
+
+        rate overrides self.rate for this call
+        """
+        rate = rate or self.rate
+
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * rate)
+        self.stamp = now
+        self.tokens -= 1
+
+        if self.tokens >= 0:
+            return 0
+
+        return -self.tokens / rate
+
+
+class HostSlot:
+    """
+    per host bookkeeping
+    """
+
+    def __init__(self, bucket):
+        self.active = 0
+        self.waiting = deque() # requests waiting on a free slot
+        self.reserved = set()  # requests holding a token from bucket
+        self.bucket = bucket
+
+        # circuit breaker
+        self.failures = 0    # in a row
+        self.open_until = 0  # time.monotonic() the breaker closes again
+        self.trial = None    # the request testing a half open breaker
+
+
+class HostLimiter:
+    """
+    limit the number of in-flight requests and the requests per second
+    sent to each host. None means unlimited.
+
+    the limits can be overridden by setting host_concurrency and/or
+    host_rate on a Request
+
+    with a breaker_threshold a host that fails that many fetches in a row
+    gets no requests for breaker_cooldown seconds, then a single request
+    is let through to see if it has recovered
+    """
+
+    def __init__(self, concurrency=None, rate=None, burst=1, breaker_threshold=None, breaker_cooldown=30.0):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self.breaker_threshold = breaker_threshold
+        self.breaker_cooldown = breaker_cooldown
+        self.hosts = {}
+
+    def slot(self, request):
+        return self.host_slot(request.url, request)
+
+    def host_slot(self, url, request=None):
+        host = url_host(url)
+
+        if host not in self.hosts:
+            rate = (request and request.host_rate) or self.rate
+            bucket = TokenBucket(rate, self.burst) if rate else None
+            self.hosts[host] = HostSlot(bucket)
+
+        return self.hosts[host]
+
+    def acquire(self, request):
+        """
+        return 0 if request may be sent now, the number of seconds to
+        wait if the host is rate limited or its circuit breaker is open,
+        or None if the host already
+        has too many requests in flight. In the last case the request is
+        held by the limiter and handed back by release()
+        """
+        slot = self.slot(request)
+        concurrency = request.host_concurrency or self.concurrency
+
+        half_open = False
+
+        if slot.open_until:
+            now = time.monotonic()
+
+            if now < slot.open_until:
+                return slot.open_until - now
+
+            if slot.trial is not None:
+                # somebody else is finding out if the host is back
+                return self.breaker_cooldown
+
+            half_open = True
+
+        if concurrency and slot.active >= concurrency:
+            slot.waiting.append(request)
+            return None
+
+        rate = request.host_rate or self.rate
+
+        if rate:
+            if slot.bucket is None:
+                slot.bucket = TokenBucket(rate, self.burst)
+
+            if request in slot.reserved:
+                # took its token when it was told to wait
+                slot.reserved.discard(request)
+            else:
+                delay = slot.bucket.consume(rate)
+
+                if delay:
+                    slot.reserved.add(request)
+                    return delay
+
+        slot.active += 1
+
+        if half_open:
+            slot.trial = request
+
+        return 0
+
+    def release(self, request):
+        """
+        request finished, return a request that was waiting on
+        this host or None
+        """
+        slot = self.slot(request)
+        slot.active -= 1
+
+        # it ended without a verdict (eg. an exception), let another try
+        if slot.trial is request:
+            slot.trial = None
+
+        if slot.waiting:
+            return slot.waiting.popleft()
+
+        return None
+
+    def clear(self):
+        """
+        a crawl was stopped, nothing is in flight any more. Return the
+        requests that were waiting on a host and forget about them
+        """
+        waiting = []
+
+        for slot in self.hosts.values():
+            waiting.extend(slot.waiting)
+            slot.waiting.clear()
+            slot.reserved.clear()
+            slot.active = 0
+
+        return waiting
+
+    def success(self, url):
+        slot = self.host_slot(url)
+        slot.failures = 0
+        slot.open_until = 0
+        slot.trial = None
+
+    def failure(self, url):
+        """
+        a fetch from url's host failed in a way that says the host is
+        in trouble, eg. a timeout or a 503
+        """
+        if not self.breaker_threshold:
+            return
+
+        slot = self.host_slot(url)
+        slot.failures += 1
+
+        if slot.trial is not None or slot.failures >= self.breaker_threshold:
+            if slot.trial is None:
+                logger.warning("%s failed %d times, backing off for %ss",
+                               url_host(url), slot.failures, self.breaker_cooldown)
+
+            slot.open_until = time.monotonic() + self.breaker_cooldown
+            slot.trial = None
+
+    def is_open(self, url):
+        return self.host_slot(url).open_until > time.monotonic()
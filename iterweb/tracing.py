@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import random
+import itertools
+from contextlib import contextmanager
+
+import aiohttp
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """
+    a named stretch of time in a request's life, start and end are
+    time.perf_counter() seconds
+    """
+
+    __slots__ = ('name', 'category', 'trace_id', 'start', 'end', 'args')
+
+    def __init__(self, name, category, trace_id, start, end, args=None):
+        self.name = name
+        self.category = category
+        self.trace_id = trace_id
+        self.start = start
+        self.end = end
+        self.args = args or {}
+
+    @property
+    def duration(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return '<Span %s %s %.6fs>' % (self.trace_id, self.name, self.duration)
+
+
+class MemorySink:
+    """
+    keeps the spans in a list, handy for tests
+    """
+
+    def __init__(self):
+        self.spans = []
+
+    def emit(self, span):
+        self.spans.append(span)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ChromeTraceSink:
+    """
+    writes spans as Chrome trace events, open the file in chrome://tracing
+    or https://ui.perfetto.dev. Every request gets its own row.
+
+    events are written as they come so memory doesn't grow with the crawl,
+    the file is valid JSON once closed (and Chrome reads it before that)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.file = open(path, 'w')
+        self.file.write('[\n')
+
+    def emit(self, span):
+        event = {
+            'name': span.name,
+            'cat': span.category,
+            'ph': 'X',
+            'ts': round(span.start * 1e6, 3),
+            'dur': round(span.duration * 1e6, 3),
+            'pid': self.pid,
+            'tid': span.trace_id,
+            'args': span.args,
+        }
+        self.file.write(json.dumps(event, default=str))
+        self.file.write(',\n')
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        # something without a trailing comma to end on
+        self.file.write(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': 'iterweb'}}))
+        self.file.write('\n]\n')
+        self.file.close()
+
+
+class Trace:
+    """
+    the spans of one sampled Request, including its retries
+    """
+
+    __slots__ = ('tracer', 'trace_id', 'url', 'queued', 'waiting')
+
+    def __init__(self, tracer, trace_id, url):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.url = url
+        self.queued = time.perf_counter()  # enqueued
+        self.waiting = self.queued         # (re)queued or parked
+
+    def add(self, name, start, end=None, category='iterweb', **args):
+        end = time.perf_counter() if end is None else end
+        self.tracer.sink.emit(Span(name, category, self.trace_id, start, end, args))
+
+    @contextmanager
+    def span(self, name, category='iterweb', **args):
+        start = time.perf_counter()
+        try:
+            yield args # add to it and it ends up in the span
+        finally:
+            self.add(name, start, category=category, **args)
+
+
+async def traced(trace, name, agen):
+    """
+    pass through async generator agen, timing only the time spent in it
+    and not in whoever is consuming it. That's one span starting when
+    agen did and as long as agen was busy, wall is the elapsed time
+    """
+    first = time.perf_counter()
+    busy = 0.0
+    steps = 0
+
+    try:
+        while True:
+            start = time.perf_counter()
+
+            try:
+                item = await agen.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                busy += time.perf_counter() - start
+                steps += 1
+
+            yield item
+
+    finally:
+        trace.add(name, first, first + busy, steps=steps, wall=time.perf_counter() - first)
+        await agen.aclose()
+
+
+class Tracer:
+    """
+    records where a Request's time goes: waiting in the queue, dns,
+    connecting, the request itself, reading the body, building the
+    Selector, the callback and each pipeline stage
+
+    sample is the fraction of Requests traced, the decision is made when
+    a Request is enqueued. sink gets every Span with emit(span), see
+    ChromeTraceSink and MemorySink
+
+    the connection phases come from an aiohttp.TraceConfig, a Spider
+    adds trace_config() to its own SessionPool, add it to your own
+    ClientSession(trace_configs=[...]) if you pass in a client
+    """
+
+    def __init__(self, sink, sample=1.0):
+        self.sink = sink
+        self.sample = sample
+        self.traces = {} # Request: Trace, only the sampled ones
+        self.ids = itertools.count(1)
+
+    def start(self, request):
+        """
+        request was enqueued, maybe start tracing it
+        """
+        if request in self.traces or random.random() >= self.sample:
+            return
+
+        self.traces[request] = Trace(self, next(self.ids), request.url)
+
+    def get(self, request):
+        return self.traces.get(request)
+
+    def finish(self, request):
+        trace = self.traces.pop(request, None)
+
+        if trace is not None:
+            trace.add('request', trace.queued, url=trace.url)
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.traces = {}
+        self.sink.close()
+
+    def trace_config(self):
+        """
+        aiohttp.TraceConfig that turns connection events into spans for
+        requests sent with trace_request_ctx=Trace
+        """
+        config = aiohttp.TraceConfig()
+
+        def phase(name, started, ended):
+            async def start(session, context, params):
+                setattr(context, name, time.perf_counter())
+
+            async def end(session, context, params):
+                trace = context.trace_request_ctx
+                if isinstance(trace, Trace) and hasattr(context, name):
+                    trace.add(name, getattr(context, name), category='connection')
+
+            started.append(start)
+            ended.append(end)
+
+        phase('dns', config.on_dns_resolvehost_start, config.on_dns_resolvehost_end)
+        phase('connect', config.on_connection_create_start, config.on_connection_create_end)
+        phase('connection_queued', config.on_connection_queued_start, config.on_connection_queued_end)
+        phase('http', config.on_request_start, config.on_request_end)
+
+        return config
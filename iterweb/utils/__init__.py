@@ -1 +1,2 @@
 from .reify import reify
+from .histogram import Histogram
@@ -0,0 +1,57 @@
+from bisect import bisect_left
+
+# seconds, roughly log spaced
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'),
+)
+
+class Histogram():
+    """
+    counts observations in fixed buckets, cheap enough to always leave on
+
+    buckets are upper bounds, the last one should be inf
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, pct):
+        """
+        upper bound of the bucket the pct (0-100) percentile falls in
+        """
+        if not self.count:
+            return 0.0
+
+        target = self.count * pct / 100.0
+        seen = 0
+
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+
+        return self.buckets[-1]
+
+    def as_dict(self):
+        """
+        cumulative counts per bucket like prometheus
+        """
+        cumulative = {}
+        seen = 0
+
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            cumulative[bound] = seen
+
+        return {'buckets': cumulative, 'count': self.count, 'sum': self.sum}
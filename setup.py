@@ -38,7 +38,7 @@ conditional_dependencies = {}
 
 setup(
     name = pkg_name,
-    packages = find_packages(exclude=['*.tests']),
+    packages = find_packages(exclude=['*.tests', 'benchmarks']),
 
     install_requires = open('requirements.txt').readlines(),
 
@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 import aiohttp
 
@@ -36,6 +38,31 @@ def client(loop, aiohttp_client):
 
     return loop.run_until_complete(aiohttp_client(app))
 
+@pytest.fixture
+def server(loop, aiohttp_client):
+    """
+    a client whose app records which pages were served and how many
+    requests were being handled at the same time
+    """
+    state = {'served': [], 'active': 0, 'max_active': 0}
+
+    async def page(request):
+        state['active'] += 1
+        state['max_active'] = max(state['max_active'], state['active'])
+
+        await asyncio.sleep(float(request.query.get('delay', 0.01)))
+
+        state['active'] -= 1
+        state['served'].append(request.path)
+        return aiohttp.web.Response(text=request.path)
+
+    app = aiohttp.web.Application()
+    app.router.add_get('/{name}', page)
+
+    client = loop.run_until_complete(aiohttp_client(app))
+    client.state = state
+    return client
+
 async def get_next(generator):
     """
     get the next page and pass to callback
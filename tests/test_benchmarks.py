@@ -0,0 +1,27 @@
+import json
+
+from benchmarks.synthetic import SyntheticSite
+from benchmarks import crawl
+
+def test_site_tree():
+    site = SyntheticSite(pages=25, fanout=3, page_size=2000)
+
+    assert site.links(0) == [1, 2, 3]
+    assert site.links(7) == [22, 23, 24]
+    assert site.links(8) == []
+    assert abs(len(site.html(0)) - 2000) < 50
+
+def test_crawl(tmp_path):
+    path = str(tmp_path / 'run.json')
+
+    assert crawl.main(['--pages', '50', '--page-size', '500', '--output', path]) == 0
+
+    with open(path) as f:
+        report = json.load(f)
+
+    assert report['results']['pages'] == 50
+    assert report['results']['items'] == 50
+    assert report['params']['pages'] == 50
+
+    # compared against itself nothing got worse
+    assert crawl.compare(report['results'], report['results'], 0.1)
@@ -0,0 +1,69 @@
+import aiohttp
+
+from iterweb import Spider, Request
+from iterweb.contentfilter import (
+    HashContentFilter, SimhashContentFilter, build_content_filter, simhash,
+)
+from iterweb.httpcache import CachedResponse
+from iterweb.reqresp import Response
+
+article = ' '.join('word%d' % i for i in range(200))
+
+def make_response(body, url='http://example.com/'):
+    resp = CachedResponse(url, 200, {'Content-Type': 'text/html'}, body.encode('utf-8'), stored=0)
+    return Response(url, resp, Request(url))
+
+def page(text, extra=''):
+    return '<html><body><p>%s</p><script>var t = "%s";</script></body></html>' % (text, extra)
+
+def test_hash():
+    f = build_content_filter('hash')
+    assert isinstance(f, HashContentFilter)
+
+    assert not f.seen(make_response(page(article)))
+    assert f.seen(make_response(page(article), url='http://example.com/?sid=1'))
+    assert not f.seen(make_response(page(article, extra='x')))
+
+    assert f.stats() == {'entries': 2, 'hits': 1, 'misses': 2}
+
+def test_simhash():
+    f = SimhashContentFilter(distance=3)
+
+    assert not f.seen(make_response(page(article, extra='session 1')))
+
+    # scripts are ignored and one changed word is close enough
+    assert f.seen(make_response(page(article, extra='session 2')))
+    assert f.seen(make_response(page(article.replace('word7 ', 'seven '))))
+
+    other = ' '.join('other%d' % i for i in range(200))
+    assert not f.seen(make_response(page(other)))
+    assert len(f) == 2
+
+def test_simhash_distance():
+    a = simhash(article.split())
+    b = simhash(article.replace('word7 ', 'seven ').split())
+    c = simhash('something else entirely'.split())
+
+    assert bin(a ^ b).count('1') <= 3
+    assert bin(a ^ c).count('1') > 3
+
+async def test_crawl(loop, aiohttp_client):
+    async def same(request):
+        return aiohttp.web.Response(text=page(article), content_type='text/html')
+
+    app = aiohttp.web.Application()
+    app.router.add_get('/{name}', same)
+    client = await aiohttp_client(app)
+
+    parsed = []
+
+    async def parse(response):
+        parsed.append(response.url)
+        yield response.url
+
+    spider = Spider(parse_func=parse, content_filter='hash')
+    items = [item async for item in spider.crawl(['/a', '/b', '/c'], client=client)]
+
+    assert items == parsed == ['/a']
+    assert spider.stats.pages_duplicate == 2
+    assert spider.content_filter.hits == 2
@@ -0,0 +1,76 @@
+import pytest
+
+from iterweb import Spider
+from iterweb.dupefilter import (
+    canonicalize_url, build_dupefilter,
+    SetDupeFilter, FingerprintDupeFilter, BloomDupeFilter,
+)
+
+from . import server
+
+@pytest.mark.parametrize('url, expected', [
+    ('http://Example.COM/a#frag', 'http://example.com/a'),
+    ('http://example.com:80/a', 'http://example.com/a'),
+    ('https://example.com:443', 'https://example.com/'),
+    ('https://example.com:8443/', 'https://example.com:8443/'),
+    ('http://example.com/a?b=2&a=1&c=', 'http://example.com/a?a=1&b=2&c='),
+    ('http://[::1]:8080/a', 'http://[::1]:8080/a'),
+    ('/relative?z=1&y=2#top', '/relative?y=2&z=1'),
+])
+def test_canonicalize(url, expected):
+    assert canonicalize_url(url) == expected
+
+@pytest.mark.parametrize('dupefilter', [
+    SetDupeFilter(), FingerprintDupeFilter(), BloomDupeFilter(capacity=1000),
+])
+def test_seen(dupefilter):
+    assert not dupefilter.seen('http://example.com/a?x=1&y=2')
+    assert dupefilter.seen('http://EXAMPLE.com:80/a?y=2&x=1#foo')
+    assert not dupefilter.seen('http://example.com/b')
+
+    assert 'http://example.com/b' in dupefilter
+    assert 'http://example.com/c' not in dupefilter
+
+    stats = dupefilter.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+    assert stats['entries'] == 2
+    assert stats['memory'] > 0
+
+def test_no_canonicalize():
+    dupefilter = SetDupeFilter(canonicalize=None)
+
+    assert not dupefilter.seen('/a#1')
+    assert not dupefilter.seen('/a#2')
+
+def test_bloom_error_rate():
+    dupefilter = BloomDupeFilter(capacity=2000, error_rate=0.01)
+
+    for i in range(2000):
+        dupefilter.add('http://example.com/%d' % i)
+
+    false_positives = sum(
+        'http://example.org/%d' % i in dupefilter for i in range(2000)
+    )
+    assert false_positives < 2000 * 0.03
+
+    # fixed size no matter how much is added
+    assert dupefilter.memory_usage() < 4000
+
+def test_build_dupefilter():
+    assert isinstance(build_dupefilter(), SetDupeFilter)
+    assert isinstance(build_dupefilter('bloom'), BloomDupeFilter)
+    assert isinstance(build_dupefilter(FingerprintDupeFilter), FingerprintDupeFilter)
+
+async def test_crawl_dupefilter(server):
+    urls = []
+
+    async def parse(response):
+        urls.append(response.url)
+
+    s = Spider(parse_func=parse, dupefilter='fingerprint')
+    await s.exhaust(['/a?x=1&y=2', '/a?y=2&x=1', '/a?x=1&y=2#frag'], client=server)
+
+    assert urls == ['/a?x=1&y=2']
+    assert s.dupefilter.hits == 2
+    assert s.visted_urls is s.dupefilter
@@ -0,0 +1,78 @@
+import aiohttp
+import pytest
+
+from iterweb import Spider, Request
+from iterweb.filters import ResponseFilter
+
+@pytest.fixture
+def files(loop, aiohttp_client):
+    """
+    pages of different types and sizes, chunked has no Content-Length
+    """
+    async def html(request):
+        return aiohttp.web.Response(text='<p>hi</p>', content_type='text/html')
+
+    async def pdf(request):
+        return aiohttp.web.Response(body=b'%PDF' * 1000, content_type='application/pdf')
+
+    async def big(request):
+        return aiohttp.web.Response(text='x' * 100000, content_type='text/plain')
+
+    async def chunked(request):
+        resp = aiohttp.web.StreamResponse(headers={'Content-Type': 'text/html'})
+        resp.enable_chunked_encoding()
+        await resp.prepare(request)
+        for _ in range(10):
+            await resp.write(b'y' * 10000)
+        await resp.write_eof()
+        return resp
+
+    app = aiohttp.web.Application()
+    app.router.add_get('/html', html)
+    app.router.add_get('/pdf', pdf)
+    app.router.add_get('/big', big)
+    app.router.add_get('/chunked', chunked)
+
+    return loop.run_until_complete(aiohttp_client(app))
+
+async def parse(response):
+    yield response.url
+
+def test_refuse():
+    f = ResponseFilter(content_types=['text/*', 'application/xhtml+xml'], max_size=100)
+
+    assert f.refuse({'Content-Type': 'text/html; charset=utf-8'}) is None
+    assert f.refuse({'Content-Type': 'application/XHTML+xml'}) is None
+    assert f.refuse({}) is None
+    assert f.refuse({'Content-Type': 'image/png'}) == 'content type image/png'
+    assert f.refuse({'Content-Type': 'text/html', 'Content-Length': '101'}) == 'content length 101'
+
+    f = ResponseFilter(predicate=lambda headers: 'X-Robots-Tag' not in headers)
+    assert f.refuse({'X-Robots-Tag': 'noindex'}) == 'predicate'
+
+async def test_spider_filters(files):
+    s = Spider(parse_func=parse, content_types='text/*', max_size=50000)
+    urls = [url async for url in s.crawl(['/html', '/pdf', '/big', '/chunked'], client=files)]
+
+    assert urls == ['/html']
+    assert s.stats.pages_filtered == 3
+    assert s.stats.fetch_errors == 0
+    assert s.stats.bytes_downloaded == len('<p>hi</p>')
+
+async def test_request_overrides(files):
+    s = Spider(parse_func=parse, content_types='text/html')
+    requests = [
+        Request('/pdf', response_filter=ResponseFilter()),
+        Request('/html', response_filter=ResponseFilter(predicate=lambda headers: False)),
+    ]
+    urls = [url async for url in s.crawl(requests, client=files)]
+
+    assert urls == ['/pdf']
+    assert s.stats.pages_filtered == 1
+
+async def test_stream(files):
+    s = Spider(parse_func=parse, content_types='text/html')
+    urls = [url async for url in s.crawl([Request('/pdf', stream=True), Request('/html', stream=True)], client=files)]
+
+    assert urls == ['/html']
+    assert s.stats.pages_filtered == 1
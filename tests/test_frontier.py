@@ -0,0 +1,68 @@
+import pytest
+
+from iterweb import Spider, Request
+from iterweb.frontier import (
+    build_frontier, FifoFrontier, LifoFrontier, PriorityFrontier
+)
+
+from . import server
+
+def drain(frontier):
+    urls = []
+    while not frontier.empty():
+        urls.append(frontier.get_nowait().url)
+    return urls
+
+@pytest.mark.parametrize('frontier, expected', [
+    (FifoFrontier(), ['a', 'b', 'c', 'd']),
+    (LifoFrontier(), ['d', 'c', 'b', 'a']),
+    (PriorityFrontier(), ['c', 'a', 'd', 'b']),
+])
+def test_order(frontier, expected):
+    frontier.put_nowait(Request('a', priority=1))
+    frontier.put_nowait(Request('b', priority=0))
+    frontier.put_nowait(Request('c', priority=5))
+    frontier.put_nowait(Request('d', priority=1))
+
+    assert drain(frontier) == expected
+
+def test_max_depth():
+    frontier = FifoFrontier(max_depth=1)
+
+    frontier.put_nowait(Request('a', depth=0))
+    frontier.put_nowait(Request('b', depth=1))
+    frontier.put_nowait(Request('c', depth=2))
+
+    assert drain(frontier) == ['a', 'b']
+    assert frontier.dropped == 1
+
+def test_build_frontier():
+    assert isinstance(build_frontier(), FifoFrontier)
+    assert isinstance(build_frontier('dfs'), LifoFrontier)
+    assert isinstance(build_frontier(PriorityFrontier), PriorityFrontier)
+    assert isinstance(build_frontier('iterweb.frontier.PriorityFrontier'), PriorityFrontier)
+    assert build_frontier('priority', max_depth=3).max_depth == 3
+
+async def test_crawl_depth(server):
+    depths = {}
+
+    async def parse(response):
+        depths[response.url] = response.depth
+        yield Request(response.url + 'x')
+
+    s = Spider(parse_func=parse, max_depth=2)
+    await s.exhaust('/a', client=server)
+
+    assert depths == {'/a': 0, '/ax': 1, '/axx': 2}
+    assert s.queue.dropped == 1
+
+async def test_crawl_priority(server):
+
+    async def parse(response):
+        yield response.url
+
+    s = Spider(parse_func=parse, frontier='priority', max_concurrency=1)
+    seeds = [Request('/%d' % i, priority=i) for i in range(4)]
+    items = [item async for item in s.crawl(seeds, client=server)]
+
+    assert items == ['/3', '/2', '/1', '/0']
@@ -0,0 +1,95 @@
+import time
+
+import aiohttp
+import pytest
+
+from iterweb import Spider
+from iterweb.httpcache import HttpCache, freshness_lifetime, parse_cache_control
+
+@pytest.fixture
+def cache_server(loop, aiohttp_client):
+    """
+    pages with different caching headers, counts full responses
+    """
+    served = []
+
+    async def fresh(request):
+        served.append(request.path)
+        return aiohttp.web.Response(text='fresh', headers={'Cache-Control': 'max-age=60'})
+
+    async def etag(request):
+        if request.headers.get('If-None-Match') == '"v1"':
+            return aiohttp.web.Response(status=304, headers={'ETag': '"v1"'})
+
+        served.append(request.path)
+        return aiohttp.web.Response(
+            text='etag', headers={'ETag': '"v1"', 'Cache-Control': 'no-cache'}
+        )
+
+    async def nostore(request):
+        served.append(request.path)
+        return aiohttp.web.Response(text='nostore', headers={'Cache-Control': 'no-store'})
+
+    app = aiohttp.web.Application()
+    app.router.add_get('/fresh', fresh)
+    app.router.add_get('/etag', etag)
+    app.router.add_get('/nostore', nostore)
+
+    client = loop.run_until_complete(aiohttp_client(app))
+    client.served = served
+    return client
+
+def test_parse_cache_control():
+    assert parse_cache_control('no-cache, max-age="60"') == {'no-cache': None, 'max-age': '60'}
+
+def test_freshness_lifetime():
+    assert freshness_lifetime({'Cache-Control': 'max-age=60'}) == 60
+    assert freshness_lifetime({'Cache-Control': 'no-cache, max-age=60'}) == 0
+    assert freshness_lifetime({'Cache-Control': 'no-store'}) is None
+    assert freshness_lifetime({}) == 0
+
+    headers = {
+        'Date': 'Mon, 01 Jan 2024 00:00:00 GMT',
+        'Expires': 'Mon, 01 Jan 2024 00:02:00 GMT',
+    }
+    assert freshness_lifetime(headers) == 120
+
+async def test_cache(cache_server, tmp_path):
+    texts = []
+
+    async def parse(response):
+        texts.append((response.status, response.text))
+
+    cache = HttpCache(str(tmp_path))
+    s = Spider(parse_func=parse, http_cache=cache, track_urls=False, max_concurrency=1)
+
+    urls = ['/fresh', '/etag', '/nostore'] * 2
+    await s.exhaust(urls, client=cache_server)
+
+    assert texts == [
+        (200, 'fresh'), (200, 'etag'), (200, 'nostore'),
+        (200, 'fresh'), (200, 'etag'), (200, 'nostore'),
+    ]
+    assert cache_server.served == ['/fresh', '/etag', '/nostore', '/nostore']
+    assert cache.stats() == {'hits': 1, 'misses': 4, 'revalidated': 1}
+
+async def test_cache_expired(loop, tmp_path):
+    cache = HttpCache(str(tmp_path))
+    s = Spider(http_cache=str(tmp_path))
+    assert isinstance(s.http_cache, HttpCache)
+
+    class FakeResp:
+        status = 200
+        headers = {'Cache-Control': 'max-age=60', 'Content-Type': 'text/html; charset=latin-1'}
+        _body = b'body'
+
+    cached = cache.store('http://example.com/', FakeResp())
+    assert cached.fresh
+    assert cached.get_encoding() == 'latin-1'
+
+    cached.stored = time.time() - 61
+    cache.save(cached)
+
+    cached = cache.lookup('http://example.com/')
+    assert not cached.fresh
+    assert cached._body == b'body'
@@ -0,0 +1,97 @@
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from iterweb import Spider, Request
+from iterweb.httpcache import CachedResponse
+from iterweb.links import LinkExtractor
+from iterweb.reqresp import Response
+
+page = b"""
+<html><head><base href="http://example.com/docs/"></head>
+<body>
+  <a href="intro.html">intro</a>
+  <a href="intro.html#top">intro again</a>
+  <a href=" /about?b=2&amp;a=1 ">about</a>
+  <a href="http://EXAMPLE.com:80/about?a=1&b=2">about again</a>
+  <a href="http://cdn.example.com/logo.png">logo</a>
+  <a href="http://other.org/">elsewhere</a>
+  <a href="mailto:me@example.com">mail</a>
+  <a href="javascript:void(0)">js</a>
+  <a>no href</a>
+  <area href="map.html">
+  <img src="pic.jpg">
+</body></html>
+"""
+
+def make_response(body=page, url='http://example.com/index.html'):
+    resp = CachedResponse(url, 200, {'Content-Type': 'text/html'}, body, stored=0)
+    return Response(url, resp, Request(url))
+
+def test_extract():
+    assert LinkExtractor().extract(make_response()) == [
+        'http://example.com/docs/intro.html',
+        'http://example.com/about?a=1&b=2',
+        'http://cdn.example.com/logo.png',
+        'http://other.org/',
+        'http://example.com/docs/map.html',
+    ]
+
+def test_filters():
+    response = make_response()
+
+    assert LinkExtractor(same_domain=True).extract(response) == [
+        'http://example.com/docs/intro.html',
+        'http://example.com/about?a=1&b=2',
+        'http://cdn.example.com/logo.png',
+        'http://example.com/docs/map.html',
+    ]
+
+    assert LinkExtractor(allow=r'/docs/', deny=[r'map']).extract(response) == [
+        'http://example.com/docs/intro.html',
+    ]
+
+    assert LinkExtractor(tags=['img'], attrs=['src']).extract(response) == [
+        'http://example.com/docs/pic.jpg',
+    ]
+
+def test_no_base():
+    response = make_response(b'<a href="a.html">a</a><a href="#frag">self</a>')
+
+    assert LinkExtractor(canonicalize=False).extract(response) == [
+        'http://example.com/a.html',
+        'http://example.com/index.html#frag',
+    ]
+
+def test_links():
+    async def parse(response):
+        pass
+
+    requests = make_response().links(allow=r'/docs/', callback=parse)
+
+    assert [r.url for r in requests] == [
+        'http://example.com/docs/intro.html',
+        'http://example.com/docs/map.html',
+    ]
+    assert all(r.callback is parse for r in requests)
+
+async def test_crawl(loop, aiohttp_client):
+    pages = {
+        '/': '<a href="/a">a</a><a href="/b">b</a><a href="http://elsewhere.org/">x</a>',
+        '/a': '<a href="/b">b</a><a href="/">home</a>',
+        '/b': '',
+    }
+
+    app = aiohttp.web.Application()
+    for path, html in pages.items():
+        app.router.add_get(path, lambda request, html=html: aiohttp.web.Response(text=html, content_type='text/html'))
+    client = await aiohttp_client(app)
+
+    class LinkSpider(Spider):
+        async def parse(self, response):
+            yield urlsplit(response.url).path
+            for request in response.links(same_domain=True):
+                yield request
+
+    paths = [path async for path in LinkSpider().crawl('/', client=client)]
+    assert paths == ['/', '/a', '/b']
@@ -0,0 +1,55 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from iterweb import Spider, Request, pure
+
+from . import client
+
+@pure
+def parse_links(response):
+    for src in response.xpath('//img/@src').getall():
+        yield {'src': src, 'pid': os.getpid(), 'depth': response.depth}
+
+    if response.url == '/beast':
+        yield Request('/google')
+
+@pure
+async def parse_title(response):
+    return response.xpath('//title/text()').get()
+
+def test_pure():
+    assert parse_links.pure
+    assert not getattr(test_pure, 'pure', False)
+
+async def test_inline(client):
+    s = Spider(parse_func=parse_links)
+    items = [item async for item in s.crawl('/beast', client=client)]
+
+    assert len(items) == 2
+    assert items[0]['pid'] == os.getpid()
+
+async def test_process_pool(client):
+    with ProcessPoolExecutor(1) as executor:
+        s = Spider(parse_func=parse_links, executor=executor)
+        items = [item async for item in s.crawl('/beast', client=client)]
+        assert not s.own_executor, "the caller shuts down its own executor"
+
+    assert [item['src'] for item in items] == [
+        '/beast/static/images/redeye.16a3a3bc36e1.jpg',
+        '/beast/static/images/clear.69d5ca8d8198.png',
+    ]
+    assert items[0]['pid'] != os.getpid()
+    assert items[0]['depth'] == 0
+
+async def test_process_pool_async(client):
+    s = Spider(parse_func=parse_title, executor=1)
+    items = [item async for item in s.crawl('/beast', client=client)]
+    await s.close()
+
+    assert items == ['Beast']
+
+    # close() shut down the executor it made
+    with pytest.raises(RuntimeError):
+        s.executor.submit(os.getpid)
@@ -0,0 +1,141 @@
+import sys
+import signal
+import asyncio
+from functools import partial
+
+from iterweb import Spider, Request
+from iterweb.persist import DiskFrontier, callback_name, resolve_callback
+
+from . import server
+
+def drain(frontier):
+    urls = []
+    while not frontier.empty():
+        urls.append(frontier.get_nowait().url)
+    return urls
+
+def module_callback(response):
+    pass
+
+def test_spill(loop, tmp_path):
+    frontier = DiskFrontier(str(tmp_path / 'crawl.db'), memory_limit=2)
+    frontier.start(Spider())
+
+    for i in range(7):
+        frontier.put_nowait(Request('/%d' % i))
+
+    assert len(frontier._queue) == 2
+    assert frontier.qsize() == 7
+    assert drain(frontier) == ['/%d' % i for i in range(7)]
+
+def test_callback_names(loop):
+    s = Spider()
+
+    assert callback_name(s.parse) == 'parse'
+    assert resolve_callback(s, 'parse') == s.parse
+
+    name = callback_name(module_callback)
+    assert name == 'tests.test_persist.module_callback'
+    assert resolve_callback(s, name) is module_callback
+
+    assert callback_name(lambda r: None) is None
+
+def test_callback_names_warn_once(loop, tmp_path, caplog):
+    async def parse(response):
+        pass
+
+    frontier = DiskFrontier(str(tmp_path / 'crawl.db'))
+    s = Spider(parse_func=parse, frontier=frontier)
+    frontier.start(s)
+
+    # the spider's callback is used anyway
+    assert callback_name(parse, s) is None
+    assert callback_name(s.parse) == 'parse'
+
+    for i in range(3):
+        frontier.put_nowait(Request('/%d' % i, callback=parse))
+        frontier.put_nowait(Request('/x%d' % i, callback=partial(module_callback)))
+
+    warnings = [r for r in caplog.records if 'can not save callback' in r.message]
+    assert len(warnings) == 1, "once for the partial, the closure is the spider's callback"
+    assert 'module_callback' in warnings[0].message
+
+async def test_resume(server, aiohttp_client, tmp_path):
+    path = str(tmp_path / 'crawl.db')
+
+    async def parse(response):
+        if response.url == '/root':
+            for i in range(6):
+                yield Request('/%d' % i)
+        yield response.url
+
+    s = Spider(parse_func=parse, frontier=DiskFrontier(path), max_concurrency=1)
+
+    # kill the crawl part way through
+    gen = s.crawl('/root', client=server)
+    async for item in gen:
+        if item == '/1':
+            break
+    await gen.aclose()
+
+    served = list(server.state['served'])
+    assert '/5' not in served
+
+    client = await aiohttp_client(server.server.app)
+    s = Spider(parse_func=parse, frontier=DiskFrontier(path), max_concurrency=1)
+    items = [item async for item in s.crawl('/root', client=client, resume=True)]
+
+    # /root and /0 were finished, we were killed while handling /1
+    # and anything else was either in flight or never fetched
+    assert items == ['/1', '/2', '/3', '/4', '/5']
+
+    # a finished crawl leaves nothing to resume
+    assert DiskFrontier(path).stale_id == 0
+
+CHILD = """
+import sys, asyncio
+from iterweb import Spider, Request
+from iterweb.persist import DiskFrontier
+
+path, root = sys.argv[1:]
+
+async def parse(response):
+    if response.url == root:
+        for i in range(60):
+            yield Request(root.replace('root', str(i)) + '?delay=0.02')
+    yield response.url
+
+async def main():
+    frontier = DiskFrontier(path, commit_interval=0.1)
+    async with Spider(parse_func=parse, frontier=frontier, max_concurrency=1) as s:
+        async for url in s.crawl(root):
+            print(url, flush=True)
+
+asyncio.run(main())
+"""
+
+async def test_resume_after_kill(server, aiohttp_client, tmp_path):
+    path = str(tmp_path / 'crawl.db')
+    root = str(server.make_url('/root'))
+
+    child = await asyncio.create_subprocess_exec(
+        sys.executable, '-c', CHILD, path, root,
+        stdout=asyncio.subprocess.PIPE,
+    )
+
+    for _ in range(31): # /root and 30 pages
+        await asyncio.wait_for(child.stdout.readline(), 10)
+
+    child.send_signal(signal.SIGKILL) # no close(), no final commit
+    await child.wait()
+
+    async def parse(response):
+        yield response.url
+
+    s = Spider(parse_func=parse, frontier=DiskFrontier(path), max_concurrency=1)
+    items = [item async for item in s.crawl(root, client=server.session, resume=True)]
+    await s.close()
+
+    # all but the last commit_interval or so of finished pages are skipped
+    assert 60 - 30 <= len(items) <= 60 - 20
+    assert items[-1].endswith('/59?delay=0.02')
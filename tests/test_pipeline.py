@@ -0,0 +1,258 @@
+import os
+import time
+import asyncio
+import threading
+
+import pytest
+
+from iterweb import Spider, Pipeline, DropItem, cpu_bound
+
+from . import server
+
+def active_stage(delay=0.05):
+    """
+    a stage that counts how many items are in it at once,
+    later items finish first
+    """
+    state = {'active': 0, 'max_active': 0}
+
+    async def active(spider, response, item):
+        state['active'] += 1
+        state['max_active'] = max(state['max_active'], state['active'])
+
+        await asyncio.sleep(delay * (5 - item) / 5 + 0.001)
+
+        state['active'] -= 1
+
+        if item == 3:
+            raise DropItem("three")
+
+        return item
+
+    return active, state
+
+async def parse(response):
+    for i in range(6):
+        yield i
+
+async def test_concurrency(server):
+    stage, state = active_stage()
+    pipeline = Pipeline([stage], concurrency=4)
+
+    s = Spider(parse_func=parse, pipeline=pipeline)
+    items = [item async for item in s.crawl('/a', client=server)]
+
+    assert items == [0, 1, 2, 4, 5], "order not preserved"
+    assert state['max_active'] == 4
+    assert not pipeline.tasks
+
+async def test_unordered(server):
+    pipeline = Pipeline([active_stage()[0]], concurrency=6, ordered=False)
+
+    s = Spider(parse_func=parse, pipeline=pipeline)
+    items = [item async for item in s.crawl('/a', client=server)]
+
+    assert items == [5, 4, 2, 1, 0]
+
+async def test_stage_concurrency(server):
+    stage, state = active_stage(delay=0.01)
+    pipeline = Pipeline([stage], concurrency=4, stage_concurrency={'active': 2})
+
+    s = Spider(parse_func=parse, pipeline=pipeline)
+    await s.exhaust('/a', client=server)
+
+    assert state['max_active'] == 2
+
+async def test_across_responses(server):
+    stage, state = active_stage()
+    pipeline = Pipeline([stage], concurrency=4)
+
+    async def one_item(response):
+        yield 0
+
+    s = Spider(parse_func=one_item, pipeline=pipeline)
+    items = [item async for item in s.crawl(['/a', '/b', '/c', '/d'], client=server)]
+
+    assert items == [0, 0, 0, 0]
+    assert state['max_active'] > 1, "items from different pages should overlap"
+
+class BatchSink:
+    batch_size = 3
+    batches = []
+
+    async def process_batch(self, spider, items):
+        BatchSink.batches.append(list(items))
+        return [None if item == 4 else item * 10 for item in items]
+
+async def test_batch_size(server):
+    BatchSink.batches = []
+    pipeline = Pipeline([BatchSink])
+    assert pipeline.concurrency == 3
+
+    s = Spider(parse_func=parse, pipeline=pipeline)
+    items = [item async for item in s.crawl('/a', client=server)]
+
+    assert BatchSink.batches == [[0, 1, 2], [3, 4, 5]]
+    assert items == [0, 10, 20, 30, 50]
+
+class SlowBatchSink:
+    batch_size = 100
+    batch_wait = 0.05
+    batches = []
+
+    async def process_batch(self, spider, items):
+        SlowBatchSink.batches.append(list(items))
+
+async def test_batch_wait(server):
+    SlowBatchSink.batches = []
+
+    async def slow_parse(response):
+        yield 1
+        yield 2
+        await asyncio.sleep(0.2)
+        yield 3
+
+    s = Spider(parse_func=slow_parse, pipeline=[SlowBatchSink])
+    items = [item async for item in s.crawl('/a', client=server)]
+
+    # first batch flushed by time, the partial one when the crawl finished
+    assert SlowBatchSink.batches == [[1, 2], [3]]
+    assert items == [1, 2, 3]
+
+async def test_batch_flushed_on_close(server):
+    SlowBatchSink.batches = []
+
+    async def slow_parse(response):
+        yield 1
+        yield 2
+        raise RuntimeError("boom")
+
+    s = Spider(parse_func=slow_parse, pipeline=[SlowBatchSink])
+
+    try:
+        await s.exhaust('/a', client=server)
+    except RuntimeError:
+        pass
+
+    assert SlowBatchSink.batches == [[1, 2]]
+
+def test_histogram():
+    from iterweb.utils import Histogram
+
+    h = Histogram(buckets=(0.1, 1.0, float('inf')))
+    for value in (0.05, 0.05, 0.5, 2.0):
+        h.observe(value)
+
+    assert h.as_dict() == {
+        'buckets': {0.1: 2, 1.0: 3, float('inf'): 4},
+        'count': 4,
+        'sum': 2.6,
+    }
+    assert h.percentile(50) == 0.1
+    assert h.percentile(75) == 1.0
+
+async def test_stats(server):
+    from iterweb import DropItemError
+
+    async def double(spider, response, item):
+        return item * 2
+
+    async def picky(spider, response, item):
+        if item == 2:
+            raise DropItem("two")
+        if item == 4:
+            raise DropItemError("four")
+        if item == 6:
+            raise ValueError("six")
+        return item
+
+    async def four(response):
+        for i in range(4):
+            yield i
+
+    pipeline = Pipeline([double, picky])
+    s = Spider(parse_func=four, pipeline=pipeline)
+    items = [item async for item in s.crawl('/a', client=server)]
+
+    assert items == [0]
+
+    stats = pipeline.stats()
+    assert list(stats) == ['double', 'picky']
+    assert stats['double']['calls'] == 4
+    assert stats['double']['latency']['count'] == 4
+    assert stats['picky'] == dict(stats['picky'], calls=4, dropped=1, errors=1, exceptions=1, in_flight=0)
+
+    pipeline.reset_stats()
+    assert pipeline.stats()['picky']['calls'] == 0
+    assert pipeline.stats()['picky']['latency']['count'] == 0
+
+async def test_max_pending_items(server):
+    # the first item is slow so everything after it waits in order
+    async def slow_first(spider, response, item):
+        await asyncio.sleep(0.1 if item == 0 else 0)
+        return item
+
+    async def many(response):
+        for i in range(20):
+            yield i
+            backlog.append(len(pipeline.tasks))
+
+    backlog = []
+    pipeline = Pipeline([slow_first], concurrency=4)
+
+    s = Spider(parse_func=many, pipeline=pipeline, max_pending_items=3)
+    items = [item async for item in s.crawl('/a', client=server)]
+
+    assert items == list(range(20))
+    assert max(backlog) <= 3
+
+def blocking(spider, response, item):
+    time.sleep(0.05)
+    return item + [threading.get_ident()]
+
+class BlockingStage:
+    def process_item(self, spider, response, item):
+        return item + [threading.get_ident()]
+
+@cpu_bound
+def heavy(spider, response, item):
+    assert spider is None and response is None
+    return item + [os.getpid()]
+
+async def test_sync_stages(server):
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0.005)
+
+    async def one(response):
+        yield []
+
+    pipeline = Pipeline([blocking, BlockingStage, heavy], executor=2, process_executor=1)
+    s = Spider(parse_func=one, pipeline=pipeline)
+
+    task = asyncio.ensure_future(ticker())
+    try:
+        items = [item async for item in s.crawl('/a', client=server)]
+    finally:
+        task.cancel()
+
+    [(thread1, thread2, pid)] = items
+    main = threading.get_ident()
+
+    assert thread1 != main and thread2 != main
+    assert pid != os.getpid()
+
+    # the loop kept running while blocking() slept
+    assert len(ticks) > 3
+
+    assert set(pipeline.stats()) == {'blocking', 'BlockingStage', 'heavy'}
+
+    await s.close()
+
+    # both were made by the pipeline
+    for executor in (pipeline.executor, pipeline.process_executor):
+        with pytest.raises(RuntimeError):
+            executor.submit(os.getpid)
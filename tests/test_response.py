@@ -0,0 +1,130 @@
+import codecs
+import pickle
+from functools import partial
+
+import aiohttp
+import pytest
+
+from iterweb import Spider
+from iterweb.httpcache import CachedResponse
+from iterweb.reqresp import Request, Response, sniff_encoding
+
+def make_response(body, content_type='text/html'):
+    url = 'http://example.com/'
+    resp = CachedResponse(url, 200, {'Content-Type': content_type}, body, stored=0)
+    return Response(url, resp, Request(url))
+
+def test_sniff_encoding():
+    assert sniff_encoding({'Content-Type': 'text/html; charset=ISO-8859-1'}, b'') == 'iso8859-1'
+    assert sniff_encoding({'Content-Type': 'text/html; charset="utf-8"'}, b'') == 'utf-8'
+
+    # bogus header charset falls through to the body
+    assert sniff_encoding({'Content-Type': 'text/html; charset=nope'}, b'') == 'utf-8'
+
+    assert sniff_encoding({}, codecs.BOM_UTF16_LE + 'hi'.encode('utf-16-le')) == 'utf-16-le'
+    assert sniff_encoding({}, b'<head><meta charset="windows-1252"></head>') == 'cp1252'
+    assert sniff_encoding({}, b'<meta http-equiv="Content-Type" content="text/html; charset=koi8-r">') == 'koi8-r'
+    assert sniff_encoding({}, b'<html></html>') == 'utf-8'
+
+def test_selector_from_bytes():
+    body = '<html><head><meta charset="latin-1"></head><p>caf\xe9</p></html>'.encode('latin-1')
+    response = make_response(body)
+
+    assert response.xpath('//p/text()').get() == 'caf\xe9'
+
+    # the Selector didn't need the decoded text
+    assert response._text is None
+    assert 'caf\xe9' in response.text
+
+def test_fields():
+    response = make_response(b'<p>x</p>')
+
+    assert response.status == 200
+    assert response.headers['Content-Type'] == 'text/html'
+    assert response.depth == 0
+
+    # still forwarded
+    assert response.from_cache
+
+def test_release():
+    response = make_response(b'<p>x</p>')
+    assert response.css('p::text').get() == 'x'
+
+    response.hold()
+    response.release()
+    assert response.body == b'<p>x</p>'
+
+    response.release()
+    assert response.body is None
+    assert response._selector is None
+
+def test_request_slots():
+    request = Request('http://example.com/')
+
+    assert not hasattr(request, '__dict__')
+    assert request.method == 'GET'
+    assert request.headers is None and request.body is None
+    assert request._meta is None
+
+    request.meta['page'] = 2
+    assert Request('/', meta={'page': 2}).meta == request.meta
+
+    with pytest.raises(AttributeError):
+        request.nonsense = 1
+
+def test_request_pickle():
+    request = Request('/', priority=3, method='post', body=b'x')
+    request.meta['a'] = 1
+    copy = pickle.loads(pickle.dumps(request))
+
+    assert (copy.url, copy.priority, copy.method, copy.body, copy.meta) == ('/', 3, 'POST', b'x', {'a': 1})
+
+def test_from_urls():
+    requests = list(Request.from_urls(['/a', '/b'], depth=2))
+
+    assert [r.url for r in requests] == ['/a', '/b']
+    assert all(r.depth == 2 and r.method == 'GET' and r.attempt == 0 for r in requests)
+    assert requests[0].meta == {}
+
+async def test_callbacks_interned(loop):
+    class MySpider(Spider):
+        async def other(self, response):
+            pass
+
+    spider = MySpider()
+    await spider.enqueue([Request('/a', callback=spider.other), Request('/b', callback=spider.other)])
+
+    a, b = spider.queue.get_nowait(), spider.queue.get_nowait()
+    assert a.callback is b.callback
+
+async def test_callbacks_not_kept(loop):
+    async def detail(response, parent):
+        pass
+
+    spider = Spider()
+    await spider.enqueue(Request('/%d' % i, callback=partial(detail, parent=i)) for i in range(100))
+
+    while not spider.queue.empty():
+        spider.queue.get_nowait()
+
+    assert len(spider.callbacks) == 1 # spider.parse
+
+async def test_method_headers_body(loop, aiohttp_client):
+    seen = []
+
+    async def echo(request):
+        seen.append((request.method, request.headers.get('X-Test'), await request.read()))
+        return aiohttp.web.Response(text='ok')
+
+    app = aiohttp.web.Application()
+    app.router.add_route('*', '/', echo)
+    client = await aiohttp_client(app)
+
+    async def parse(response):
+        yield response.request.meta['n']
+
+    spider = Spider(parse_func=parse)
+    request = Request('/', method='post', headers={'X-Test': 'yes'}, body=b'data', meta={'n': 1})
+
+    assert [item async for item in spider.crawl(request, client=client)] == [1]
+    assert seen == [('POST', 'yes', b'data')]
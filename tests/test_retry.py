@@ -0,0 +1,120 @@
+import time
+import asyncio
+from collections import Counter
+
+import aiohttp
+import pytest
+
+from iterweb import Spider
+from iterweb.retry import RetryPolicy, is_retryable
+
+@pytest.fixture
+def flaky_server(loop, aiohttp_client):
+    """
+    /flaky/<n> fails with a 503 n times then works
+    /down always fails
+    /hang takes a second
+    """
+    hits = Counter()
+    times = {}
+
+    async def flaky(request):
+        hits[request.path] += 1
+        times[request.path] = time.monotonic()
+
+        if hits[request.path] <= int(request.match_info['n']):
+            raise aiohttp.web.HTTPServiceUnavailable()
+
+        return aiohttp.web.Response(text=request.path)
+
+    async def down(request):
+        hits[request.path] += 1
+        raise aiohttp.web.HTTPServiceUnavailable()
+
+    async def hang(request):
+        await asyncio.sleep(1)
+        return aiohttp.web.Response(text='hang')
+
+    app = aiohttp.web.Application()
+    app.router.add_get('/flaky/{n}', flaky)
+    app.router.add_get('/down/{n}', down)
+    app.router.add_get('/hang', hang)
+
+    client = loop.run_until_complete(aiohttp_client(app))
+    client.hits = hits
+    client.times = times
+    return client
+
+async def parse(response):
+    yield response.url
+
+def test_delay():
+    error = aiohttp.ClientResponseError(None, (), status=503)
+    policy = RetryPolicy(retries=3, backoff=0.5, max_backoff=1.5, jitter=False)
+
+    assert [policy.delay(i, error) for i in range(4)] == [0.5, 1.0, 1.5, None]
+
+    policy = RetryPolicy(retries=3, backoff=0.5)
+    assert 0 <= policy.delay(2, error) <= 2.0
+
+    not_found = aiohttp.ClientResponseError(None, (), status=404)
+    assert policy.delay(0, not_found) is None
+
+    limited = aiohttp.ClientResponseError(None, (), status=429, headers={'Retry-After': '7'})
+    assert policy.delay(0, limited) == 7
+
+def test_is_retryable():
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(aiohttp.ServerDisconnectedError())
+    assert not is_retryable(aiohttp.InvalidURL('foo'))
+
+async def test_retry(flaky_server):
+    s = Spider(parse_func=parse, retry=RetryPolicy(retries=3, backoff=0.01))
+    items = [item async for item in s.crawl(['/flaky/2', '/flaky/0'], client=flaky_server)]
+
+    assert sorted(items) == ['/flaky/0', '/flaky/2']
+    assert flaky_server.hits['/flaky/2'] == 3
+    assert s.stats.retries == 2
+    assert s.stats.fetch_errors == 0
+
+async def test_give_up(flaky_server):
+    s = Spider(parse_func=parse, retry=RetryPolicy(retries=2, backoff=0.01))
+    items = [item async for item in s.crawl('/down/1', client=flaky_server)]
+
+    assert items == []
+    assert flaky_server.hits['/down/1'] == 3
+    assert s.stats.fetch_errors == 1
+
+async def test_timeout(flaky_server):
+    s = Spider(parse_func=parse, timeout=0.1)
+
+    start = time.monotonic()
+    items = [item async for item in s.crawl('/hang', client=flaky_server)]
+
+    assert items == []
+    assert time.monotonic() - start < 0.5
+    assert s.stats.fetch_errors == 1
+
+async def test_breaker(flaky_server):
+    s = Spider(parse_func=parse, max_concurrency=1, breaker_threshold=2, breaker_cooldown=0.2)
+
+    start = time.monotonic()
+    items = [item async for item in s.crawl(['/down/1', '/down/2', '/flaky/0'], client=flaky_server)]
+
+    assert items == ['/flaky/0']
+    assert flaky_server.times['/flaky/0'] - start >= 0.2, "breaker should have held /flaky/0 back"
+    assert not s.limiter.is_open('/flaky/0')
+
+async def test_breaker_not_found(flaky_server):
+    s = Spider(parse_func=parse, max_concurrency=1, breaker_threshold=1, breaker_cooldown=0.2)
+
+    await s.exhaust(['/down/1', '/missing'], client=flaky_server)
+
+    # the 404 trial showed the host is back
+    items = await asyncio.wait_for(collect(s.crawl('/flaky/0', client=flaky_server)), 5)
+
+    assert items == ['/flaky/0']
+    assert not s.limiter.is_open('/flaky/0')
+
+async def collect(crawl):
+    return [item async for item in crawl]
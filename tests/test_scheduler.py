@@ -0,0 +1,101 @@
+import asyncio
+
+from iterweb import Spider, Request
+
+from . import server
+
+async def test_max_concurrency(server):
+
+    async def parse(response):
+        yield response.url
+
+    s = Spider(parse_func=parse, max_concurrency=2)
+    urls = ['/%d' % i for i in range(8)]
+    items = [item async for item in s.crawl(urls, client=server)]
+
+    assert items == urls, "items not in queue order"
+    assert server.state['max_active'] == 2
+
+async def test_slow_page_does_not_stall(server):
+
+    async def parse(response):
+        yield response.url
+
+    s = Spider(parse_func=parse, max_concurrency=2)
+    urls = ['/slow?delay=0.3'] + ['/%d' % i for i in range(6)]
+    await s.exhaust(urls, client=server)
+
+    # the other worker got through every fast page while slow was in flight
+    assert server.state['served'][-1] == '/slow'
+
+async def test_callback_requests_picked_up(server):
+
+    async def parse(response):
+        if response.url == '/root':
+            for i in range(5):
+                yield Request('/child%d' % i)
+        else:
+            yield response.url
+
+    s = Spider(parse_func=parse, max_concurrency=3)
+    items = [item async for item in s.crawl('/root', client=server)]
+
+    assert items == ['/child%d' % i for i in range(5)]
+    assert s.queue.empty()
+    assert server.state['max_active'] <= 3
+
+async def test_unordered(server):
+
+    async def parse(response):
+        yield response.url
+
+    s = Spider(parse_func=parse, max_concurrency=4)
+    urls = ['/slow?delay=0.2', '/1', '/2', '/3']
+
+    items = [item async for item in s.crawl(urls, client=server, ordered=False)]
+    assert sorted(items) == sorted(urls)
+    assert items[-1] == '/slow?delay=0.2', "slow page should be handled last"
+
+async def test_exhaust_unordered(server):
+    urls = []
+
+    async def parse(response):
+        urls.append(response.url)
+
+    s = Spider(parse_func=parse, track_urls=False)
+    await s.exhaust(['/slow?delay=0.1', '/fast'], client=server, ordered=False)
+
+    assert urls == ['/fast', '/slow?delay=0.1']
+
+async def test_slow_consumer(server):
+
+    async def parse(response):
+        yield response.url
+
+    s = Spider(parse_func=parse, max_concurrency=2, max_buffered_responses=2)
+    urls = ['/%d?delay=0' % i for i in range(20)]
+
+    ahead = []
+    async for item in s.crawl(urls, client=server):
+        # fetched but not consumed yet, counting this one
+        ahead.append(len(server.state['served']) - len(ahead))
+        await asyncio.sleep(0.01)
+
+    assert len(ahead) == 20
+    assert max(ahead) <= 1 + 2 + 2 # this one, max_buffered, max_concurrency
+    assert s.stats.fetch_pauses > 0
+
+async def test_max_buffered_bytes(server):
+
+    async def parse(response):
+        yield response.url
+
+    s = Spider(parse_func=parse, max_concurrency=2, max_buffered_responses=None, max_buffered_bytes=1)
+    urls = ['/%d?delay=0' % i for i in range(10)]
+
+    ahead = []
+    async for item in s.crawl(urls, client=server):
+        ahead.append(len(server.state['served']) - len(ahead))
+        await asyncio.sleep(0.01)
+
+    assert max(ahead) <= 1 + 1 + 2
@@ -0,0 +1,53 @@
+import aiohttp
+
+from iterweb import Spider
+from iterweb.session import SessionPool
+
+from . import client
+
+async def parse(response):
+    yield response.url
+
+async def test_reused_across_crawls(loop, aiohttp_server):
+    app = aiohttp.web.Application()
+    app.router.add_get('/{name}', lambda request: aiohttp.web.Response(text=request.path))
+    server = await aiohttp_server(app)
+
+    async with Spider(parse_func=parse, max_concurrency=1) as spider:
+        for name in ('a', 'b', 'c'):
+            urls = [url async for url in spider.crawl(str(server.make_url('/' + name)))]
+            assert len(urls) == 1
+            assert not spider.session_pool.closed
+
+        stats = spider.session_pool.stats()
+
+    assert spider.session_pool.closed
+    assert stats['requests'] == 3
+    assert stats['connections_created'] == 1
+    assert stats['connections_reused'] == 2
+    assert abs(stats['reuse_ratio'] - 2 / 3) < 1e-9
+
+    assert spider.stats.as_dict()['connections'] == stats
+    assert 'iterweb_connections_reused_total 2\n' in spider.stats.prometheus()
+
+async def test_shared_pool(loop):
+    pool = SessionPool(limit=10, limit_per_host=2, ttl_dns_cache=60)
+
+    a = Spider(session_pool=pool)
+    b = Spider(session_pool=pool)
+    assert a.session_pool.session() is b.session_pool.session()
+
+    connector = pool.session().connector
+    assert connector.limit == 10
+    assert connector.limit_per_host == 2
+
+    await pool.close()
+    assert pool.closed
+
+async def test_client_left_open(client):
+    s = Spider(parse_func=parse)
+    assert [url async for url in s.crawl('/', client=client)] == ['/']
+
+    # the caller's client can crawl again
+    assert [url async for url in s.crawl('/beast', client=client)] == ['/beast']
+    assert not client.session.closed
@@ -0,0 +1,157 @@
+import time
+import asyncio
+
+import aiohttp
+import pytest
+
+from iterweb import Spider, Request
+from iterweb.shard import ShardedRunner, shard_for, to_wire
+
+from . import exhaust
+
+PAGES = 10
+
+class LinkSpider(Spider):
+    """
+    module level so the shards can import it
+    """
+    async def parse(self, response):
+        for request in response.links():
+            yield request
+        yield {'url': response.url}
+
+class FailSpider(Spider):
+    async def parse(self, response):
+        raise ValueError("parse failed")
+
+async def parse_page(response):
+    pass
+
+class Tag:
+    async def process_item(self, spider, response, item):
+        item['tagged'] = response is None
+        return item
+
+class Batch:
+    batch_wait = 1.0
+
+    async def process_batch(self, spider, items):
+        for item in items:
+            item['batched'] = len(items)
+        return items
+
+@pytest.fixture
+def hosts(loop, aiohttp_server):
+    """
+    the same pages served as two hosts, each page links to the next
+    page on both hosts
+    """
+    async def page(request):
+        n = int(request.match_info['n'])
+        links = ''
+        if n + 1 < PAGES:
+            links = ''.join('<a href="%s/p/%d">next</a>' % (base, n + 1) for base in bases)
+        return aiohttp.web.Response(text=links, content_type='text/html')
+
+    app = aiohttp.web.Application()
+    app.router.add_get('/p/{n}', page)
+
+    server = loop.run_until_complete(aiohttp_server(app))
+    bases = ['http://127.0.0.1:%d' % server.port, 'http://localhost:%d' % server.port]
+    return bases
+
+@pytest.fixture
+def slow_host(loop, aiohttp_server):
+    """
+    a chain of 40 slow pages
+    """
+    async def page(request):
+        n = int(request.match_info['n'])
+        await asyncio.sleep(0.1)
+        links = '<a href="/p/%d">next</a>' % (n + 1) if n + 1 < 40 else ''
+        return aiohttp.web.Response(text=links, content_type='text/html')
+
+    app = aiohttp.web.Application()
+    app.router.add_get('/p/{n}', page)
+
+    server = loop.run_until_complete(aiohttp_server(app))
+    return 'http://127.0.0.1:%d' % server.port
+
+def test_shard_for():
+    assert shard_for('http://a.com/x', 4) == shard_for('http://A.com/y?z', 4)
+    assert {shard_for('http://host%d.com/' % i, 4) for i in range(50)} == {0, 1, 2, 3}
+
+def test_to_wire():
+    request = Request('http://a.com/', callback=parse_page)
+    wire = to_wire(request)
+
+    assert wire.callback == 'tests.test_shard.parse_page'
+    assert request.callback is parse_page, "the caller's Request is left alone"
+    assert wire.url == request.url
+
+async def test_route_once(loop):
+    routed = []
+
+    def route(request):
+        routed.append(request.url)
+        return request.url.startswith('http://other')
+
+    s = Spider(route=route)
+    await s.enqueue(['http://other/a', 'http://mine/b', 'http://other/a', 'http://mine/b'])
+
+    assert routed == ['http://other/a', 'http://mine/b']
+    assert s.queue.qsize() == 1
+
+async def test_crawl(hosts):
+    # enough shards that the two hosts land on different ones
+    shards = next(n for n in range(2, 20) if shard_for(hosts[0], n) != shard_for(hosts[1], n))
+
+    runner = ShardedRunner(LinkSpider, shards=shards)
+    items = [item async for item in runner.crawl(hosts[0] + '/p/0')]
+
+    urls = sorted(item['url'] for item in items)
+    assert urls == sorted(
+        ['%s/p/%d' % (hosts[0], n) for n in range(PAGES)] +
+        ['%s/p/%d' % (hosts[1], n) for n in range(1, PAGES)]
+    )
+
+    # each shard only fetched its own host
+    fetched = sorted(s['pages_fetched'] for s in runner.stats.values())
+    assert fetched[-2:] == [PAGES - 1, PAGES] and sum(fetched) == 2 * PAGES - 1
+
+async def test_parent_pipeline(hosts):
+    runner = ShardedRunner(LinkSpider, shards=2, pipeline_in='parent', pipeline=[Tag])
+    items = [item async for item in runner.crawl([base + '/p/8' for base in hosts])]
+
+    assert len(items) == 4
+    assert all(item['tagged'] for item in items)
+
+async def test_parent_pipeline_batch(hosts):
+    runner = ShardedRunner(LinkSpider, shards=2, pipeline_in='parent', pipeline=[Batch])
+
+    start = time.monotonic()
+    items = [item async for item in runner.crawl([base + '/p/6' for base in hosts])]
+
+    # batched together instead of each waiting out batch_wait
+    assert len(items) == 8
+    assert all(item['batched'] > 1 for item in items)
+    assert time.monotonic() - start < 4
+
+async def test_stop_early(slow_host):
+    runner = ShardedRunner(LinkSpider, shards=1)
+    crawl = runner.crawl(slow_host + '/p/0')
+
+    await crawl.__anext__()
+
+    # the shard stops in the middle of its crawl
+    start = time.monotonic()
+    await crawl.aclose()
+
+    assert time.monotonic() - start < 2
+    assert 0 < runner.stats[0]['pages_fetched'] < 10
+
+async def test_shard_error(hosts):
+    runner = ShardedRunner(FailSpider, shards=1)
+
+    with pytest.raises(RuntimeError, match='parse failed'):
+        await asyncio.wait_for(exhaust(runner.crawl(hosts[0] + '/p/0')), 20)
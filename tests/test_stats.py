@@ -0,0 +1,64 @@
+import aiohttp
+
+from iterweb import Spider, Request
+
+from . import server, client
+
+async def parse(response):
+    if response.url == '/root':
+        yield Request('/a')
+        yield Request('/a')
+        yield Request('/b')
+    yield response.url
+
+async def test_counters(server):
+    s = Spider(parse_func=parse)
+    await s.exhaust('/root', client=server)
+
+    stats = s.stats.as_dict()
+
+    assert stats['requests_enqueued'] == 3
+    assert stats['requests_duplicate'] == 1
+    assert stats['requests_emitted'] == 3
+    assert stats['pages_fetched'] == 3
+    assert stats['fetch_errors'] == 0
+    assert stats['bytes_downloaded'] == len('/root/a/b')
+    assert stats['items_yielded'] == 3
+    assert stats['in_flight'] == 0
+    assert stats['queue_depth'] == 0
+    assert stats['status'] == {200: 3}
+    assert stats['fetch_latency']['count'] == 3
+
+async def test_fetch_errors(client):
+    s = Spider(parse_func=parse)
+    await s.exhaust('/missing', client=client)
+
+    assert s.stats.fetch_errors == 1
+    assert s.stats.status == {404: 1}
+
+async def test_prometheus(server):
+    s = Spider(parse_func=parse, stats_interval=0.01)
+    await s.exhaust('/root', client=server)
+
+    text = s.stats.prometheus()
+
+    assert '# TYPE iterweb_pages_fetched_total counter\niterweb_pages_fetched_total 3\n' in text
+    assert 'iterweb_responses_total{status="200"} 3\n' in text
+    assert 'iterweb_fetch_seconds_bucket{le="+Inf"} 3\n' in text
+    assert 'iterweb_fetch_seconds_count 3\n' in text
+
+async def test_serve(loop):
+    s = Spider()
+    s.stats.pages_fetched = 42
+
+    runner = await s.stats.serve(port=0)
+    port = runner.addresses[0][1]
+
+    try:
+        async with aiohttp.ClientSession() as session:
+            async with session.get('http://127.0.0.1:%d/metrics' % port) as resp:
+                text = await resp.text()
+    finally:
+        await runner.cleanup()
+
+    assert 'iterweb_pages_fetched_total 42\n' in text
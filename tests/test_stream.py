@@ -0,0 +1,63 @@
+import aiohttp
+import pytest
+
+from iterweb import Spider, Request
+
+SIZE = 1024 * 1024
+
+@pytest.fixture
+def big_server(loop, aiohttp_client):
+
+    async def big(request):
+        resp = aiohttp.web.StreamResponse()
+        await resp.prepare(request)
+
+        for _ in range(SIZE // 4096):
+            await resp.write(b'x' * 4096)
+
+        await resp.write_eof()
+        return resp
+
+    app = aiohttp.web.Application()
+    app.router.add_get('/big', big)
+
+    return loop.run_until_complete(aiohttp_client(app))
+
+async def test_iter_chunks(big_server):
+    sizes = []
+
+    async def parse(response):
+        assert response.body is None, "body should not have been read"
+
+        async for chunk in response.iter_chunks(1024):
+            sizes.append(len(chunk))
+
+    s = Spider(parse_func=parse)
+    await s.exhaust(Request('/big', stream=True), client=big_server)
+
+    assert sum(sizes) == SIZE
+    assert max(sizes) <= 1024
+
+async def test_save(big_server, tmp_path):
+    path = str(tmp_path / 'big')
+
+    async def parse(response):
+        yield await response.save(path)
+
+    s = Spider(parse_func=parse)
+    items = [item async for item in s.crawl(Request('/big', stream=True), client=big_server)]
+
+    assert items == [SIZE]
+    with open(path, 'rb') as f:
+        assert len(f.read()) == SIZE
+
+async def test_released(big_server):
+    responses = []
+
+    async def parse(response):
+        responses.append(response)
+
+    s = Spider(parse_func=parse)
+    await s.exhaust(Request('/big', stream=True), client=big_server)
+
+    assert responses[0]._response.closed
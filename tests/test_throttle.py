@@ -0,0 +1,146 @@
+import time
+import asyncio
+
+from iterweb import Spider, Request
+from iterweb.throttle import HostLimiter, TokenBucket, url_host
+
+from . import server
+
+def test_url_host():
+    assert url_host('http://Example.com:8080/a') == 'example.com:8080'
+    assert url_host('/relative') == ''
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, burst=2)
+
+    assert bucket.consume() == 0
+    assert bucket.consume() == 0
+
+    delay = bucket.consume()
+    assert 0 < delay <= 0.1
+
+    # each caller reserves its own turn
+    assert 0.1 < bucket.consume() <= 0.2
+
+def test_limiter_concurrency():
+    limiter = HostLimiter(concurrency=1)
+    a1 = Request('http://a.com/1')
+    a2 = Request('http://a.com/2')
+    b1 = Request('http://b.com/1')
+
+    assert limiter.acquire(a1) == 0
+    assert limiter.acquire(a2) is None, "a.com should be saturated"
+    assert limiter.acquire(b1) == 0, "b.com should not be blocked by a.com"
+
+    assert limiter.release(a1) is a2
+    assert limiter.release(b1) is None
+
+def test_limiter_request_override():
+    limiter = HostLimiter(concurrency=1)
+    a1 = Request('http://a.com/1')
+    a2 = Request('http://a.com/2', host_concurrency=2)
+
+    assert limiter.acquire(a1) == 0
+    assert limiter.acquire(a2) == 0
+
+def test_limiter_rate():
+    limiter = HostLimiter(rate=10)
+
+    assert limiter.acquire(Request('http://a.com/1')) == 0
+    assert limiter.acquire(Request('http://a.com/2')) > 0
+    assert limiter.acquire(Request('http://b.com/1')) == 0
+
+async def test_crawl_host_concurrency(server):
+
+    async def parse(response):
+        yield response.url
+
+    s = Spider(parse_func=parse, max_concurrency=4, host_concurrency=1)
+    urls = ['/%d' % i for i in range(6)]
+    items = [item async for item in s.crawl(urls, client=server)]
+
+    assert sorted(items) == sorted(urls)
+    assert server.state['max_active'] == 1
+
+def test_limiter_rate_reserved():
+    limiter = HostLimiter(rate=10)
+    a2 = Request('http://a.com/2')
+    a3 = Request('http://a.com/3')
+
+    assert limiter.acquire(Request('http://a.com/1')) == 0
+    assert 0 < limiter.acquire(a2) <= 0.1
+    assert 0.1 < limiter.acquire(a3) <= 0.2
+
+    # a2 comes back when its turn is up and doesn't need another token
+    assert limiter.acquire(a2) == 0
+
+async def test_crawl_host_rate(server):
+
+    async def parse(response):
+        yield response.url
+
+    s = Spider(parse_func=parse, host_rate=20)
+    urls = ['/%d?delay=0' % i for i in range(5)]
+
+    start = time.monotonic()
+    await s.exhaust(urls, client=server)
+
+    # first request is free, the other four wait 1/20s each
+    assert time.monotonic() - start >= 0.19
+    assert len(server.state['served']) == 5
+
+async def test_crawl_stopped_early(server):
+
+    async def parse(response):
+        yield response.url
+
+    s = Spider(parse_func=parse, max_concurrency=4, host_concurrency=1)
+
+    crawl = s.crawl(['/%d' % i for i in range(6)], client=server)
+    await crawl.__anext__()
+    await crawl.aclose()
+
+    assert not any(slot.waiting or slot.active for slot in s.limiter.hosts.values())
+
+    # the requests that were waiting on the host are still in the queue
+    await asyncio.wait_for(s.exhaust('/new', client=server), 5)
+    assert '/new' in server.state['served']
+
+def test_breaker_trial_released():
+    limiter = HostLimiter(breaker_threshold=1, breaker_cooldown=0.01)
+    a1 = Request('http://a.com/1')
+    a2 = Request('http://a.com/2')
+
+    assert limiter.acquire(a1) == 0
+    limiter.failure(a1.url)
+    limiter.release(a1)
+
+    time.sleep(0.02)
+    assert limiter.acquire(a1) == 0, "a1 is the half open trial"
+    assert limiter.acquire(a2) > 0, "only one trial at a time"
+
+    # the trial ended without a success or failure, eg. an exception
+    limiter.release(a1)
+    assert limiter.acquire(a2) == 0
+
+async def test_crawl_host_rate_acquires(server):
+
+    async def parse(response):
+        yield response.url
+
+    s = Spider(parse_func=parse, max_concurrency=4, host_rate=200)
+    calls = 0
+    acquire = s.limiter.acquire
+
+    def counting(request):
+        nonlocal calls
+        calls += 1
+        return acquire(request)
+
+    s.limiter.acquire = counting
+    urls = ['/%d?delay=0' % i for i in range(40)]
+    await s.exhaust(urls, client=server)
+
+    assert len(server.state['served']) == 40
+    # once when dequeued and once more when its turn is up
+    assert calls <= 2 * len(urls)
@@ -0,0 +1,69 @@
+import json
+
+import aiohttp
+
+from iterweb import Spider, Request
+from iterweb.tracing import Tracer, MemorySink
+
+from . import server
+
+async def parse(response):
+    yield response.xpath('//title/text()').get() or 'untitled'
+
+async def stage(spider, response, item):
+    return item
+
+def names(spans, trace_id=1):
+    return [span.name for span in spans if span.trace_id == trace_id]
+
+async def test_spans(server):
+    sink = MemorySink()
+    s = Spider(parse_func=parse, pipeline=[stage], tracer=Tracer(sink))
+
+    await s.exhaust(['/a', '/b'], client=server)
+
+    # connection phases come from the session's TraceConfig which the
+    # test client doesn't have
+    # spans are emitted when they end, the callback is still running
+    # while the Selector is built and its item goes through the pipeline
+    assert names(sink.spans) == ['queue', 'download', 'fetch', 'selector', 'stage', 'callback', 'request']
+    assert names(sink.spans, 2)[-1] == 'request'
+
+    callback = next(span for span in sink.spans if span.name == 'callback')
+    assert callback.args['steps'] == 2
+    assert all(span.duration >= 0 for span in sink.spans)
+
+    assert not s.tracer.traces
+
+async def test_sampling(server):
+    sink = MemorySink()
+    s = Spider(parse_func=parse, tracer=Tracer(sink, sample=0))
+
+    await s.exhaust(['/a', '/b'], client=server)
+    assert sink.spans == []
+
+async def test_max_depth(server):
+    s = Spider(parse_func=parse, tracer=Tracer(MemorySink()), max_depth=0, trace_sample=0.5)
+
+    await s.exhaust([Request('/a'), Request('/b', depth=1)], client=server)
+
+    assert not s.tracer.traces, "the dropped Request isn't left behind"
+    assert not hasattr(s, 'trace_sample')
+
+async def test_chrome_trace(loop, aiohttp_server, tmp_path):
+    app = aiohttp.web.Application()
+    app.router.add_get('/', lambda request: aiohttp.web.Response(text='<title>hi</title>', content_type='text/html'))
+    web = await aiohttp_server(app)
+
+    path = str(tmp_path / 'trace.json')
+
+    async with Spider(parse_func=parse, tracer=path) as s:
+        assert [item async for item in s.crawl(str(web.make_url('/')))] == ['hi']
+
+    with open(path) as f:
+        events = json.load(f)
+
+    spans = [e['name'] for e in events if e['ph'] == 'X']
+    # no dns span, aiohttp doesn't resolve an ip address
+    assert {'queue', 'connect', 'http', 'download', 'fetch', 'request'} <= set(spans)
+    assert all(e['dur'] >= 0 for e in events if e['ph'] == 'X')